@@ -9,8 +9,14 @@ Script which submits convergence tests.
 
 from input import *
 
+import datetime
+
+from ase.io import read
 from pymatgen.core.structure import Structure
 
+from common.results import read_results
+from common.convergence import coarse_indices, refine, extend_series, wait_for_results, failed_states, \
+    pending_states
 from common.SubmitFirework import SubmitFirework
 
 # full path to poscar file
@@ -37,9 +43,52 @@ if mode == 'encut':
     if 'encut_values' not in globals():
         encut_values = range(500, 1010, 10)
 
-    convtest = SubmitFirework(path_to_poscar, mode='encut', fix_params=params, magmoms=configuration,
-                              encut_values=encut_values)
-    convtest.submit()
+    if 'adaptive' not in globals() or not adaptive:
+        convtest = SubmitFirework(path_to_poscar, mode='encut', fix_params=params, magmoms=configuration,
+                                  encut_values=encut_values)
+        convtest.submit()
+    else:
+        if 'coarse_stride' not in globals():
+            coarse_stride = 8
+        if 'poll_interval' not in globals():
+            poll_interval = 60
+        if 'timeout' not in globals():
+            timeout = None
+
+        atoms = read(path_to_poscar)
+        material = atoms.get_chemical_formula(mode='metal', empirical=True)
+        encut_values = sorted(encut_values)
+
+        # results of previous runs of this script are reused
+        try:
+            records = {record['state']: record for record in read_results(material, 'encut')}
+        except FileNotFoundError:
+            records = {}
+
+        # submit a coarse grid first, then bisect around the first converged value
+        energies = {}
+        converged, batch = None, coarse_indices(len(encut_values), coarse_stride)
+        while converged is None:
+            todo = [index for index in batch if f'encut{encut_values[index]}' not in records]
+            if todo:
+                # calculations submitted by an interrupted run of this script are not submitted again
+                since = datetime.datetime.now(datetime.timezone.utc)
+                pending = pending_states(material, 'encut', [f'encut{encut_values[index]}' for index in todo])
+                todo = [index for index in todo if f'encut{encut_values[index]}' not in pending]
+                if todo:
+                    convtest = SubmitFirework(path_to_poscar, mode='encut', fix_params=params, magmoms=configuration,
+                                              encut_values=[encut_values[index] for index in todo])
+                    convtest.submit()
+                records = wait_for_results(lambda: read_results(material, 'encut'),
+                                           [f'encut{encut_values[index]}' for index in batch], poll_interval, timeout,
+                                           lambda missing: failed_states(material, 'encut', missing, since))
+
+            for index in batch:
+                energies[index] = records[f'encut{encut_values[index]}']['energy'] / len(atoms)
+            converged, batch = refine(energies, len(encut_values))
+
+        print(f'ENCUT = {encut_values[converged]} eV gives an error of less than 1 meV/atom w. r. t. the most '
+              f'accurate result, found with {len(energies)} calculations out of {len(encut_values)} trial values.')
 
 # convergence test w.r.t. sigma and kpts
 if mode == 'kgrid':
@@ -49,6 +98,59 @@ if mode == 'kgrid':
     if 'kpts_values' not in globals():
         kpts_values = range(20, 110, 10)
 
-    convtest = SubmitFirework(path_to_poscar, mode='kgrid', fix_params=params, magmoms=configuration,
-                              sigma_values=sigma_values, kpts_values=kpts_values)
-    convtest.submit()
+    if 'adaptive' not in globals() or not adaptive:
+        convtest = SubmitFirework(path_to_poscar, mode='kgrid', fix_params=params, magmoms=configuration,
+                                  sigma_values=sigma_values, kpts_values=kpts_values)
+        convtest.submit()
+    else:
+        if 'poll_interval' not in globals():
+            poll_interval = 60
+        if 'timeout' not in globals():
+            timeout = None
+
+        atoms = read(path_to_poscar)
+        material = atoms.get_chemical_formula(mode='metal', empirical=True)
+        kpts_values = sorted(kpts_values)
+
+        # results of previous runs of this script are reused
+        try:
+            records = {record['state']: record for record in read_results(material, 'kgrid')}
+        except FileNotFoundError:
+            records = {}
+
+        # extend each SIGMA series to larger R_k values while its energy still changes
+        series = {sigma: [] for sigma in sigma_values}
+        todo = extend_series(series, len(kpts_values))
+        while todo:
+            states = [f'kgrid{sigma}-{kpts_values[index]}' for sigma, indices in todo.items() for index in indices]
+
+            # calculations submitted by an interrupted run of this script are not submitted again
+            since = datetime.datetime.now(datetime.timezone.utc)
+            pending = pending_states(material, 'kgrid', [state for state in states if state not in records])
+
+            # series which need the same new R_k values are submitted together
+            submissions = {}
+            for sigma, indices in todo.items():
+                kpts = tuple(kpts_values[index] for index in indices
+                             if f'kgrid{sigma}-{kpts_values[index]}' not in records
+                             and f'kgrid{sigma}-{kpts_values[index]}' not in pending)
+                if kpts:
+                    submissions.setdefault(kpts, []).append(sigma)
+
+            for kpts, sigmas in submissions.items():
+                convtest = SubmitFirework(path_to_poscar, mode='kgrid', fix_params=params, magmoms=configuration,
+                                          sigma_values=sigmas, kpts_values=list(kpts))
+                convtest.submit()
+
+            if any(state not in records for state in states):
+                records = wait_for_results(lambda: read_results(material, 'kgrid'), states, poll_interval, timeout,
+                                           lambda missing: failed_states(material, 'kgrid', missing, since))
+
+            for sigma, indices in todo.items():
+                series[sigma].extend(records[f'kgrid{sigma}-{kpts_values[index]}']['energy'] / len(atoms)
+                                     for index in indices)
+            todo = extend_series(series, len(kpts_values))
+
+        n_calculations = sum(len(energies) for energies in series.values())
+        print(f'{n_calculations} calculations out of {len(sigma_values) * len(kpts_values)} trial values were '
+              f'needed, run 2_plot_results.py to plot the results.')
@@ -9,12 +9,13 @@ Script which plots results of convergence tests.
 
 from input import mode, poscar_file
 
-import os
 import numpy as np
 import matplotlib.pyplot as plt
 
 from ase.io import read
 
+from common.results import read_results
+
 # increase matplotlib pyplot font size
 plt.rcParams.update({'font.size': 20})
 
@@ -61,20 +62,11 @@ def single_plot(X, Y, label=None):
 # set figure size
 plt.figure(figsize=(16, 9))
 
-# read only lines which do not start with space
-lines = []
-calcfold = os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold')
-with open(os.path.join(calcfold, f"{atoms.get_chemical_formula(mode='metal', empirical=True)}_{mode}.txt"), 'r') as f:
-    for line in f:
-        if line[0] != ' ':
-            lines.append(line)
-
 # extract the results
 params, energies, = [], []
-for line in lines:
-    values = line.split()
-    params.append(values[0].strip(mode))
-    energies.append(values[-1].split('=')[1])
+for record in read_results(atoms.get_chemical_formula(mode='metal', empirical=True), mode):
+    params.append(record['state'].strip(mode))
+    energies.append(record['energy'])
 
 if mode == 'encut':
     single_plot(params, energies)
@@ -29,6 +29,19 @@ params = {
 # choose the trial values for ENCUT (default from 500 to 1000 eV at steps of 10 eV)
 # encut_values = range(350, 610, 10)
 
+# compute only a coarse grid of ENCUT values and then refine around the converged one, or extend each SIGMA series
+# to larger R_k values only until its energy is converged (default False)
+# adaptive = True
+
+# distance between consecutive ENCUT values of the coarse grid, in units of trial values (default 8)
+# coarse_stride = 8
+
+# seconds between two consecutive checks for new results in adaptive mode (default 60)
+# poll_interval = 60
+
+# maximum number of seconds to wait for the results of each batch in adaptive mode (default no limit)
+# timeout = 86400
+
 # choose the trial values for SIGMA (default from 0.05 to 0.2 eV at steps of 0.05 eV)
 # sigma_values = [item / 100 for item in range(5, 25, 5)]
 
@@ -7,17 +7,25 @@ Script which plots results of linear response U calculation.
 .. codeauthor:: Michele Galasso <m.galasso@yandex.com>
 """
 
-import os
+from input import poscar_file
+
 import numpy as np
 import matplotlib.pyplot as plt
 
 from scipy import stats
+from ase.io import read
+
+from common.results import read_results
 
 # increase matplotlib pyplot font size
 plt.rcParams.update({'font.size': 20})
 
-calcfold = os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold')
-data = np.loadtxt(os.path.join(calcfold, 'charges.txt'))
+# create an ase atoms object
+path_to_poscar = '../geometries/' + poscar_file
+atoms = read(path_to_poscar)
+
+records = read_results(atoms.get_chemical_formula(mode='metal', empirical=True), 'perturbations')
+data = np.array([[record['pert_value']] + record['charges'] for record in records])
 
 perturbations = data[:, 0]
 nscf = data[:, 1]
@@ -2,7 +2,7 @@
 automag.2_coll.1_submit
 =======================
 
-Script which runs enumlib and submits calculations.
+Script which enumerates magnetic configurations and submits calculations.
 
 .. codeauthor:: Michele Galasso <m.galasso@yandex.com>
 """
@@ -10,113 +10,53 @@ Script which runs enumlib and submits calculations.
 from input import *
 
 import os
-import subprocess
 import numpy as np
+import multiprocessing
 
 from itertools import product
-from pymatgen.io.vasp import Poscar
 from pymatgen.core.structure import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 
+from common.enumeration import enumerate_split, match_sites, symmetry_permutations, prune_configurations
 from common.SubmitFirework import SubmitFirework
 
 
-def launch_enumlib(count, split):
-    os.mkdir(f'enumlib{count}')
-    os.chdir(f'enumlib{count}')
+def add_configuration(index, candidate_conf):
+    candidate_conf = np.asarray(candidate_conf)
 
-    with open('struct_enum.in', 'w') as f:
-        f.write('generated by Automag\n')
-        f.write('bulk\n')
+    # if the configuration is not NM and the first non-zero spin is negative flip all spins
+    nonzero_indices = np.flatnonzero(candidate_conf)
+    if len(nonzero_indices) > 0 and candidate_conf[nonzero_indices[0]] < 0:
+        candidate_conf = -candidate_conf
 
-        for lat_vector in symmetrized_structure.lattice.matrix:
-            for component in lat_vector:
-                f.write(f'{component:14.10f}        ')
-            f.write('\n')
+    # add to list of configurations for the current settings, using a hashable key for fast lookup
+    key = (candidate_conf.astype(float) + 0.).tobytes()
+    if key not in configuration_keys[index]:
+        configuration_keys[index].add(key)
+        configurations[index].append(candidate_conf.tolist())
 
-        case = len(split) + sum(split)
-        f.write(f'  {case} -nary case\n')
-        f.write(f'    {symmetrized_structure.num_sites} # Number of points in the multilattice\n')
 
-        offset = 0
-        for i, (s, wyckoff) in enumerate(zip(split, symmetrized_structure.equivalent_sites)):
-            if s:
-                offset += 1
+def lattice_key(lattice):
+    # lattice vectors rounded to 1e-6 Angstrom, getting rid of the minus zero values
+    return (np.around(lattice.matrix, 6) + 0.).tobytes()
 
-            for atom in wyckoff:
-                for component in atom.coords:
-                    f.write(f'{component:14.10f}        ')
-                if s:
-                    f.write(f'{i + offset - 1}/{i + offset}\n')
-                else:
-                    f.write(f'{i + offset}\n')
 
-        f.write(f'    1 {supercell_size}   # Starting and ending cell sizes for search\n')
-        f.write('0.10000000E-06 # Epsilon (finite precision parameter)\n')
-        f.write('full list of labelings\n')
-        f.write('# Concentration restrictions\n')
-
-        for s, wyckoff in zip(split, symmetrized_structure.equivalent_sites):
-            if s:
-                for _ in range(2):
-                    f.write(f'{len(wyckoff):4d}')
-                    f.write(f'{len(wyckoff):4d}')
-                    f.write(f'{symmetrized_structure.num_sites * 2:4d}\n')
-            else:
-                f.write(f'{len(wyckoff) * 2:4d}')
-                f.write(f'{len(wyckoff) * 2:4d}')
-                f.write(f'{symmetrized_structure.num_sites * 2:4d}\n')
-
-    # process = subprocess.Popen('/home/michele/softs/enumlib/src/enum.x')
-    process = subprocess.Popen('enum.x')
-    try:
-        process.wait(timeout=60)
-    except subprocess.TimeoutExpired:
-        process.kill()
-
-    # solve a bug of enumlib which produces an extra new line
-    with open('struct_enum.out', 'rt') as file:
-        lines = file.readlines()
-
-    line_number = 0
-    os.remove('struct_enum.out')
-    with open('struct_enum.out', 'wt') as file:
-        while line_number < len(lines):
-            line = lines[line_number]
-            if '(Non)Equivalency list' not in line:
-                file.write(line)
-                line_number += 1
-            else:
-                file.write(line.strip('\n'))
-
-                offset = 0
-                while not lines[line_number + offset + 1].startswith('start'):
-                    file.write(' ' + lines[line_number + offset + 1].strip('\n'))
-                    offset += 1
-
-                file.write('\n')
-                line_number += offset + 1
-
-    # os.system('/home/michele/softs/enumlib/aux_src/makeStr.py 1 500')
-    os.system('makeStr.py 1 500')
-
-    for j in range(501):
-        if os.path.isfile(f'vasp.{j + 1}'):
-            conf_poscar = Poscar.from_file(f'vasp.{j + 1}')
-        else:
-            break
-
-        if conf_poscar.structure.lattice in lattices:
-            index = lattices.index(conf_poscar.structure.lattice)
-            current_coords = conf_poscar.structure.frac_coords.tolist()
-            reference_coords = coordinates[index].tolist()
-            mapping = [np.nonzero([np.allclose(cur, ref) for cur in current_coords])[0][0] for ref in reference_coords]
+def add_split_configurations(split, derivatives):
+    for lattice, frac_coords, labels in derivatives:
+        key = lattice_key(lattice)
+        if key in lattice_indices:
+            index = lattice_indices[key]
+            mapping = match_sites(coordinates[index], frac_coords)
+            if mapping is None:
+                raise ValueError('Sites of the enumerated structure do not match the reference setting.')
         else:
-            lattices.append(conf_poscar.structure.lattice)
-            coordinates.append(conf_poscar.structure.frac_coords)
+            lattice_indices[key] = len(lattices)
+            lattices.append(lattice)
+            coordinates.append(frac_coords)
             configurations.append([])
+            configuration_keys.append(set())
             index = len(lattices) - 1
-            mapping = list(range(len(conf_poscar.structure.frac_coords)))
+            mapping = list(range(len(frac_coords)))
 
         counter = 0
         split_groups = []
@@ -132,7 +72,7 @@ def launch_enumlib(count, split):
                 counter += 1
 
         # adapt equivalent_multipliers in case of supercells
-        coefficient = len(conf_poscar.structure) // len(structure)
+        coefficient = len(frac_coords) // len(structure)
 
         current_multipliers = []
         for multiplier in equivalent_multipliers:
@@ -146,26 +86,26 @@ def launch_enumlib(count, split):
                 if sum(conf_array[group]) != 0:
                     flag = False
             if flag:
-                configuration = np.repeat(conf, conf_poscar.natoms)
+                configuration = np.array(conf)[labels]
                 transformed_configuration = configuration[mapping]
 
                 for mult in current_multipliers:
-                    candidate_conf = np.multiply(transformed_configuration, mult).tolist()
+                    candidate_conf = np.multiply(transformed_configuration, mult)
 
                     # if all spins are zero do not include the NM configuration
-                    if len(np.nonzero(candidate_conf)[0]) > 0:
-                        first_nonzero_index = np.nonzero(candidate_conf)[0][0]
+                    if np.any(candidate_conf):
+                        add_configuration(index, candidate_conf)
 
-                        # if the first non-zero spin is negative flip all spins
-                        if candidate_conf[first_nonzero_index] < 0:
-                            candidate_conf = [-item for item in candidate_conf]
-
-                        # add to list of configurations for the current settings
-                        if candidate_conf not in configurations[index]:
-                            configurations[index].append(candidate_conf)
-
-    os.chdir('..')
 
+# take care of the case when the parallelization options have not been specified
+if 'num_processes' not in globals():
+    num_processes = 1
+if 'split_time_budget' not in globals():
+    split_time_budget = None
+if 'warm_start' not in globals():
+    warm_start = False
+if 'skip_recalc' not in globals():
+    skip_recalc = False
 
 # full path to poscar file
 path_to_poscar = '../geometries/' + poscar_file
@@ -191,8 +131,10 @@ os.chdir('trials')
 
 # geometrical settings and respective lists of magnetic configurations
 lattices = [structure.lattice]
+lattice_indices = {lattice_key(structure.lattice): 0}
 coordinates = [structure.frac_coords]
 configurations = [[]]
+configuration_keys = [set()]
 
 # get the multiplicities of each Wyckoff position
 multiplicities = [len(item) for item in symmetrized_structure.equivalent_indices]
@@ -250,19 +192,8 @@ for conf in product(*wyckoff_magmoms):
     configuration = np.repeat(conf, multiplicities)
 
     for mult in equivalent_multipliers:
-        candidate_conf = np.multiply(configuration, mult).tolist()
-
-        # if the configuration is not NM, get the index of the first non-zero element
-        if len(np.nonzero(candidate_conf)[0]) > 0:
-            first_nonzero_index = np.nonzero(candidate_conf)[0][0]
-
-            # if the first non-zero spin is negative flip all spins
-            if candidate_conf[first_nonzero_index] < 0:
-                candidate_conf = [-item for item in candidate_conf]
-
-        # add to list of configurations for the current settings
-        if candidate_conf not in configurations[0]:
-            configurations[0].append(candidate_conf)
+        candidate_conf = np.multiply(configuration, mult)
+        add_configuration(0, candidate_conf)
 
 # split all possible combinations of Wyckoff positions
 splits = []
@@ -271,8 +202,21 @@ for split in product(*possibilities):
     if sum(split) != 0:
         splits.append(split)
 
-for i, split in enumerate(splits):
-    launch_enumlib(i + 1, split)
+# enumerate derivative structures for each split, in parallel if requested
+jobs = [(symmetrized_structure, split, supercell_size, split_time_budget) for split in splits]
+if num_processes > 1:
+    # fork, so that worker processes do not run this script again
+    with multiprocessing.get_context('fork').Pool(num_processes) as pool:
+        results = pool.starmap(enumerate_split, jobs)
+else:
+    results = [enumerate_split(*job) for job in jobs]
+
+# merge results following the order of the splits, so that the output does not depend on the workers
+for split, (derivatives, complete) in zip(splits, results):
+    if not complete:
+        print(f'WARNING: enumeration for split {split} stopped after {split_time_budget} s, '
+              f'only {len(derivatives)} derivative structure(s) will be used.')
+    add_split_configurations(split, derivatives)
 
 # merge the first and second settings if they are equivalent
 if len(lattices) > 1:
@@ -292,6 +236,8 @@ if len(lattices) > 1:
             del coordinates[0]
             configurations[0].extend(configurations[1])
             del configurations[1]
+            configuration_keys[0].update(configuration_keys[1])
+            del configuration_keys[1]
 
 # write output and submit calculations
 fm_count = 1
@@ -305,25 +251,32 @@ for i, (lattice, frac_coords, confs) in enumerate(zip(lattices, coordinates, con
     setting.to(fmt='poscar', filename=f'setting{i + 1:03d}.vasp')
     mask = [item.is_magnetic for item in setting.species]
 
-    for conf in confs:
+    # keep only one configuration for each set of symmetrically equivalent ones
+    confs, orbit_sizes = prune_configurations(confs, symmetry_permutations(setting))
+
+    lines = []
+    states = []
+    for conf, orbit_size in zip(confs, orbit_sizes):
         conf_array = np.array(conf)
-        with open(f'configurations{i + 1:03d}.txt', 'a') as f:
-            if np.sum(np.abs(conf)) == 0:
-                state = 'nm'
-            elif min(conf) >= 0:
-                state = 'fm' + str(fm_count)
-                fm_count += 1
-            elif np.sum(conf) == 0:
-                state = 'afm' + str(afm_count)
-                afm_count += 1
-            else:
-                state = 'fim' + str(fim_count)
-                fim_count += 1
+        if np.sum(np.abs(conf)) == 0:
+            state = 'nm'
+        elif min(conf) >= 0:
+            state = 'fm' + str(fm_count)
+            fm_count += 1
+        elif np.sum(conf) == 0:
+            state = 'afm' + str(afm_count)
+            afm_count += 1
+        else:
+            state = 'fim' + str(fim_count)
+            fim_count += 1
+
+        states.append(state)
+        lines.append(f'{state:>6s}  {orbit_size:3d}  ' + ' '.join(f'{e:2d}' for e in conf_array[mask]) + '\n')
 
-            f.write(f'{state:>6s}  ')
-            f.write(' '.join(f'{e:2d}' for e in conf_array[mask]))
-            f.write('\n')
+    with open(f'configurations{i + 1:03d}.txt', 'wt') as f:
+        f.writelines(lines)
 
-        run = SubmitFirework(f'setting{i + 1:03d}.vasp', mode='singlepoint', fix_params=params, magmoms=conf,
-                             name=state)
-        run.submit()
+    # the structure of the setting is read only once and all workflows are inserted with a single bulk call
+    run = SubmitFirework(f'setting{i + 1:03d}.vasp', mode='singlepoint', fix_params=params, warm_start=warm_start,
+                         skip_recalc=skip_recalc)
+    run.submit_configurations(confs, states)
@@ -15,11 +15,12 @@ import shutil
 import numpy as np
 import matplotlib.pyplot as plt
 
-from copy import copy
 from ase.io import read
 from pymatgen.core.structure import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 
+from common.results import read_results
+
 
 def better_sort(state):
     if state[0] == 'nm':
@@ -44,96 +45,81 @@ analyzer = SpacegroupAnalyzer(structure)
 symmetrized_structure = analyzer.get_symmetrized_structure()
 multiplicities = np.array([len(item) for item in symmetrized_structure.equivalent_indices])
 
-# path to results file with data
-calcfold = os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold')
-output_file = os.path.join(calcfold, f"{atoms.get_chemical_formula(mode='metal', empirical=True)}_singlepoint.txt")
-
 # exit if no trials folder
 if not os.path.isdir('trials'):
     raise IOError('No trials folder found.')
 
-# read lines
-lines, maginfos, presents = [], [], []
-with open(output_file, 'rt') as f:
-    for line in f:
-        if line[0] != ' ':
-            presents.append(line.split()[0])
-            lines.append(line)
-        else:
-            maginfos.append(line)
-
-data = {}
+# read results
+records = read_results(atoms.get_chemical_formula(mode='metal', empirical=True), 'singlepoint')
+
+# read the trial configurations of all settings
+trial_states, trial_settings, trial_spins = [], [], []
 setting = 1
-not_found = []
 while os.path.isfile(f'trials/configurations{setting:03d}.txt'):
     with open(f'trials/configurations{setting:03d}.txt', 'rt') as f:
         for line in f:
             values = line.split()
-            init_state = values[0]
-            if init_state in presents:
-                dct = {
-                    'setting': setting,
-                    'init_spins': [int(item) for item in values[1:]],
-                }
-                data[init_state] = dct
-            else:
-                not_found.append(init_state)
+            trial_states.append(values[0])
+            trial_settings.append(setting)
+            trial_spins.append([int(item) for item in values[2:]])
     setting += 1
 
-# keep the maximum value of setting
-max_setting = copy(setting)
-
-# extract the results
-red = []
-not_converged = []
-all_final_magmoms = []
-for line, maginfo in zip(lines, maginfos):
-    values = line.split()
-    init_state = values[0]
-
-    if values[-4].split('=')[1] == 'NONCONVERGED':
-        not_converged.append(init_state)
-        del data[init_state]
-    else:
-        initial, final = maginfo.split('final_magmoms=')
-        initial = initial[initial.index('[') + 1:initial.index(']')]
-        final = final[final.index('[') + 1:final.index(']')]
-        initial = np.array(initial.split(), dtype=float)
-        final = np.array(final.split(), dtype=float)
-
-        all_final_magmoms.extend(final.tolist())
-
-        # exclude low-spin configurations
-        flag = False
-        mask = np.nonzero(initial)
-        if np.all(np.abs(final[mask]) > lower_cutoff) or init_state == 'nm':
-            flag = True
-
-        magnification = len(initial) // sum(multiplicities)
-        current_multiplicities = magnification * multiplicities
-
-        start = 0
-        kept = True
-        for multiplicity in current_multiplicities:
-            w_initial = initial[start:start + multiplicity]
-            w_final = final[start:start + multiplicity]
-            start += multiplicity
-
-            if not np.any(w_initial):
-                if np.any(np.around(w_final)):
-                    kept = False
-            else:
-                prod = np.multiply(np.sign(w_initial), w_final)
-                if prod.max() - prod.min() > 0.08:
-                    kept = False
-
-        if kept and flag:
-            data[init_state]['kept_magmoms'] = True
-        else:
-            data[init_state]['kept_magmoms'] = False
-            red.append(init_state)
-
-        data[init_state]['energy'] = float(values[-1].split('=')[1]) / len(initial)     # energy per atom
+# join trial configurations with results, keeping the order of the trials
+record_indices = {record['state']: i for i, record in enumerate(records)}
+not_found = [state for state in trial_states if state not in record_indices]
+not_converged = [state for state in trial_states if state in record_indices
+                 and records[record_indices[state]]['convergence'][-1][1] == 'NONCONVERGED']
+excluded = set(not_found + not_converged)
+rows = [i for i, state in enumerate(trial_states) if state not in excluded]
+
+# exit if no configuration has a usable result
+if len(rows) == 0:
+    raise IOError('No converged results found for the trial configurations.')
+
+# columnar table of results, with initial and final magmoms as 2-D arrays padded with zeros
+table = np.zeros(len(rows), dtype=[('state', f'U{max(len(state) for state in trial_states)}'), ('setting', int),
+                                   ('natoms', int), ('energy', float), ('kept_magmoms', bool)])
+table['state'] = [trial_states[i] for i in rows]
+table['setting'] = [trial_settings[i] for i in rows]
+table['natoms'] = [len(records[record_indices[state]]['initial_magmoms']) for state in table['state']]
+
+initial = np.zeros((len(table), table['natoms'].max()))
+final = np.zeros((len(table), table['natoms'].max()))
+for j, state in enumerate(table['state']):
+    record = records[record_indices[state]]
+    initial[j, :table['natoms'][j]] = record['initial_magmoms']
+    final[j, :table['natoms'][j]] = record['final_magmoms']
+    table['energy'][j] = record['energy']
+
+# energy per atom
+table['energy'] /= table['natoms']
+
+# flatten magmoms of all configurations, one after the other
+valid = np.arange(initial.shape[1]) < table['natoms'][:, np.newaxis]
+initial_flat = initial[valid]
+final_flat = final[valid]
+all_final_magmoms = final_flat
+config_starts = np.cumsum(table['natoms']) - table['natoms']
+
+# exclude low-spin configurations
+low_spin = (initial_flat != 0) & (np.abs(final_flat) <= lower_cutoff)
+flag = (np.add.reduceat(low_spin, config_starts) == 0) | (table['state'] == 'nm')
+
+# segments of magmoms belonging to the same Wyckoff position, taking care of supercells
+magnification = table['natoms'] // sum(multiplicities)
+segment_sizes = (magnification[:, np.newaxis] * multiplicities[np.newaxis, :]).ravel()
+segment_starts = np.cumsum(segment_sizes) - segment_sizes
+
+# NM Wyckoff positions must stay NM, the others must keep the same absolute value of the magmoms
+prod = np.sign(initial_flat) * final_flat
+initially_magnetic = np.add.reduceat(initial_flat != 0, segment_starts) > 0
+finally_magnetic = np.add.reduceat(np.around(final_flat) != 0, segment_starts) > 0
+spread = np.maximum.reduceat(prod, segment_starts) - np.minimum.reduceat(prod, segment_starts)
+segment_kept = np.where(initially_magnetic, spread <= 0.08, ~finally_magnetic)
+kept = np.logical_and.reduceat(segment_kept, np.arange(len(table)) * len(multiplicities))
+
+table['kept_magmoms'] = kept & flag
+red = table['state'][~table['kept_magmoms']].tolist()
 
 if len(red) != 0:
     print(f"The following {len(red)} configuration(s) did not keep the original magmoms and will be marked in red "
@@ -145,35 +131,35 @@ if len(not_found) != 0:
     print(f"The following {len(not_found)} configuration(s) reported an error during energy calculation and will "
           f"not be shown on the graph: {', '.join(not_found)}")
 
+# electronic iterations of warm-started recalc runs and of the single-point runs they restarted from
+scf_iterations = np.array([[dict(records[record_indices[state]].get('scf_iterations', [])).get(name, 0)
+                            for name in ['singlepoint', 'recalc']] for state in table['state']
+                           if 'recalc' in records[record_indices[state]].get('warm_started', [])],
+                          dtype=int).reshape(-1, 2)
+if globals().get('warm_start', False) and scf_iterations.all(axis=1).any():
+    sp_total, recalc_total = scf_iterations[scf_iterations.all(axis=1)].sum(axis=0)
+    # only recalc runs which start from the same magmoms as the single-point run are warm-started
+    print(f'The warm-started recalc runs took {recalc_total} electronic iterations and the corresponding '
+          f'single-point runs took {sp_total}, a difference of {sp_total - recalc_total} iterations.')
+
 # plt.hist(np.abs(all_final_magmoms), bins=40)
 # plt.savefig('spin_distribution.png')
 
-setting = 1
-final_states = []
-final_setting = setting
-final_energies = []
-final_min = np.inf
-while setting < max_setting:
-    current_states = []
-    current_energies = []
-    for init_state, value in data.items():
-        if init_state != 'nm' and value['setting'] == setting and value['kept_magmoms']:
-            current_states.append(np.sign(value['init_spins']).tolist())
-            current_energies.append(value['energy'])
-    if min(current_energies) < final_min:
-        final_setting = setting
-        final_states = current_states
-        final_energies = current_energies
-        final_min = min(current_energies)
-    setting += 1
+# minimum energy of each setting among magnetic configurations which kept their magmoms
+candidates = (table['state'] != 'nm') & table['kept_magmoms']
+settings, inverse = np.unique(table['setting'][candidates], return_inverse=True)
+setting_minima = np.full(len(settings), np.inf)
+np.minimum.at(setting_minima, inverse, table['energy'][candidates])
+final_setting = settings[np.argmin(setting_minima)]
 
 # filter out configurations containing NM states
 tc_states = []
 tc_energies = []
-for state, energy in zip(final_states, final_energies):
+for j in np.nonzero(candidates & (table['setting'] == final_setting))[0]:
+    state = np.sign(trial_spins[rows[j]]).tolist()
     if 0 not in state:
         tc_states.append(state)
-        tc_energies.append(energy)
+        tc_energies.append(float(table['energy'][j]))
 
 # write states to file
 with open(f'states{final_setting:03d}.txt', 'wt') as f:
@@ -187,16 +173,10 @@ with open(f'energies{final_setting:03d}.txt', 'wt') as f:
 shutil.copy(f'trials/setting{final_setting:03d}.vasp', '.')
 
 # extract values for plot
-bar_labels = []
-energies = []
-kept_magmoms = []
-for key, value in sorted(data.items(), key=better_sort):
-    bar_labels.append(key)
-    energies.append(value['energy'])
-    kept_magmoms.append(value['kept_magmoms'])
-
-energies = np.array(energies)
-kept_magmoms = np.array(kept_magmoms)
+order = sorted(range(len(table)), key=lambda j: better_sort(table[j]))
+bar_labels = table['state'][order].tolist()
+energies = table['energy'][order]
+kept_magmoms = table['kept_magmoms'][order]
 
 # energies from eV/atom to meV/atom
 energies *= 1000
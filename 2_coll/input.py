@@ -35,3 +35,16 @@ params = {
 
 # specify a cutoff for picking only high-spin configurations from output
 # lower_cutoff = 1.7
+
+# number of processes used to enumerate magnetic configurations (default 1)
+# num_processes = 8
+
+# maximum time in seconds spent enumerating each split of Wyckoff positions (default no limit)
+# split_time_budget = 600
+
+# start the recalc runs from the wavefunctions and charge density of the single-point runs when the magnetic
+# moments are unchanged (default False)
+# warm_start = True
+
+# do not run the recalc run when the rounded magnetic moments of the single-point run are unchanged (default False)
+# skip_recalc = True
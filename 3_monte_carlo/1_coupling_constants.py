@@ -15,6 +15,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
+from scipy.sparse import csr_matrix
 from pymatgen.core.structure import Structure
 
 # initialize variables
@@ -56,18 +57,31 @@ for element in structure.composition.elements:
 energies = structure.num_sites * np.array(energies)
 
 
+def shell_incidence(distances, unique_distances):
+    """
+    Assign each neighbor pair to the coordination shells it belongs to.
+
+    :param distances: distances of the neighbor pairs.
+    :param unique_distances: distances which identify the coordination shells.
+    :return: sparse matrix of shape (shells, pairs) with ones where a pair belongs to a shell.
+    """
+    shells, pairs = np.nonzero(np.isclose(distances[np.newaxis, :], unique_distances[:, np.newaxis], atol=0.02))
+    return csr_matrix((np.ones(len(pairs), dtype=int), (shells, pairs)),
+                      shape=(len(unique_distances), len(distances)))
+
+
 def system(configurations):
-    matrix = []
-    for item in configurations:
-        equation = [1]
-        for distance in unique_distances:
-            count = 0
-            for atom1, atom2, d in zip(center_indices, point_indices, distances):
-                if np.isclose(d, distance, atol=0.02):
-                    count += item[atom1] * item[atom2]
-            equation.append(-count // 2)
-        matrix.append(equation)
-    return np.array(matrix)
+    spins = np.asarray(configurations)
+    if spins.ndim == 1:
+        spins = spins.reshape(-1, len(structure))
+
+    # spin products of all neighbor pairs for all configurations at once
+    pair_products = spins[:, center_indices] * spins[:, point_indices]
+    counts = (incidence @ pair_products.T).T
+
+    matrix = np.ones((len(spins), len(unique_distances) + 1), dtype=counts.dtype)
+    matrix[:, 1:] = -counts // 2
+    return matrix
 
 
 non_magnetic_atoms = [element.symbol for element in structure.composition.elements if not element.is_magnetic]
@@ -76,6 +90,7 @@ center_indices, point_indices, offset_vectors, distances = structure.get_neighbo
 
 # get unique distances
 unique_distances, counts = np.unique(np.around(distances, 2), return_counts=True)
+incidence = shell_incidence(distances, unique_distances)
 
 # create fit and control group
 fit_group_size = 1 - control_group_size
@@ -0,0 +1,54 @@
+"""
+automag.3_monte_carlo.2_run_monte_carlo.py
+==========================================
+
+Script which runs a Monte Carlo simulation of the Heisenberg model with the built-in engine, as an
+alternative to Vampire. The results are written in the file output, in the same format used by Vampire.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+from input import *
+
+import numpy as np
+
+from common.heisenberg import read_configuration, coordination_shells
+from common.monte_carlo import supercell_interactions, curie_temperature
+
+# read the configuration from ../2_coll, keeping only the magnetic atoms
+structure, materials = read_configuration(configuration, globals().get('magnetic_atoms'))
+center_indices, point_indices, offset_vectors, distances = structure.get_neighbor_list(cutoff_radius)
+
+# assign each interaction to a coordination shell
+shells, kept = coordination_shells(distances, distances_between_neighbors, len(coupling_constants))
+
+# simulation parameters, with the same meaning as in the Vampire input file
+if 'system_size' not in globals():
+    system_size = 5.0
+if 'minimum_temperature' not in globals():
+    minimum_temperature = 0
+if 'maximum_temperature' not in globals():
+    maximum_temperature = 1200
+if 'temperature_increment' not in globals():
+    temperature_increment = 10
+if 'equilibration_steps' not in globals():
+    equilibration_steps = 1000
+if 'loop_steps' not in globals():
+    loop_steps = 2000
+if 'seed' not in globals():
+    seed = None
+
+# repeat the unit cell to obtain a system of at least system_size nm along each lattice vector
+size = [int(np.ceil(10 * system_size / length)) for length in structure.lattice.abc]
+interactions = supercell_interactions(len(structure), center_indices[kept], point_indices[kept],
+                                      offset_vectors[kept], np.asarray(coupling_constants)[shells[kept]], size)
+print(f'Simulating a {size[0]}x{size[1]}x{size[2]} supercell with {interactions.shape[0]} spins')
+
+temperatures = np.arange(minimum_temperature, maximum_temperature + temperature_increment / 2, temperature_increment)
+with open('output', 'w') as f:
+    f.write('# temperature mean-magnetisation-length material-mean-magnetisation-length\n')
+    for row in curie_temperature(interactions, np.tile(materials, np.prod(size)), temperatures,
+                                 equilibration_steps, loop_steps, seed):
+        f.write('  '.join(f'{item:.10g}' for item in row) + '\n')
+        f.flush()
+        print('  '.join(f'{item:.6g}' for item in row))
@@ -0,0 +1,154 @@
+"""
+automag.3_monte_carlo.2_run_vampire.py
+======================================
+
+Script which runs Vampire in parallel over the temperature range of the simulation.
+
+The temperature range of the Vampire input file is split into contiguous chunks and one Vampire process is
+launched for each chunk, in a separate working directory, by a pool of worker processes. The output files of
+all chunks are finally merged into the file output read by 3_plot_results.py. Usage:
+
+`python 2_run_vampire.py [--processes N] [--chunks N] [--vampire BINARY] [--input FILE]`
+
+The Vampire binary can also be given with the environment variable VAMPIRE.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import shutil
+import argparse
+import subprocess
+import numpy as np
+import multiprocessing
+
+
+def read_input(filename):
+    """
+    Read a Vampire input file.
+
+    :param filename: path to the input file.
+    :return: tuple with the list of lines and a dictionary with the value of each keyword.
+    """
+    with open(filename, 'rt') as f:
+        lines = f.readlines()
+
+    keywords = {}
+    for line in lines:
+        line = line.split('#')[0].strip()
+        if '=' in line:
+            key, value = line.split('=', 1)
+            keywords[key.strip()] = value.split('!')[0].strip()
+
+    return lines, keywords
+
+
+def split_temperatures(keywords, n_chunks):
+    """
+    Split the temperature range of a Vampire input file into contiguous chunks.
+
+    :param keywords: dictionary with the value of each keyword of the input file.
+    :param n_chunks: number of chunks.
+    :return: list of tuples with the minimum and the maximum temperature of each chunk.
+    """
+    minimum = float(keywords.get('sim:minimum-temperature', 0))
+    maximum = float(keywords.get('sim:maximum-temperature', 0))
+    increment = float(keywords.get('sim:temperature-increment', 1))
+    temperatures = minimum + increment * np.arange(int(round((maximum - minimum) / increment)) + 1)
+
+    return [(chunk[0], chunk[-1]) for chunk in np.array_split(temperatures, n_chunks) if len(chunk) > 0]
+
+
+def write_chunk(folder, lines, keywords, input_dir, temperatures):
+    """
+    Prepare the working directory of a chunk, with the input file restricted to its temperature range and
+    the material and unit cell files.
+
+    :param folder: working directory of the chunk.
+    :param lines: lines of the Vampire input file.
+    :param keywords: dictionary with the value of each keyword of the input file.
+    :param input_dir: folder of the Vampire input file, where the other files are searched if they are not
+        found in the current directory.
+    :param temperatures: tuple with the minimum and the maximum temperature of the chunk.
+    """
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    for key in ['material:file', 'material:unit-cell-file']:
+        if key in keywords:
+            filename = keywords[key]
+            source = filename if os.path.isfile(filename) else os.path.join(input_dir, filename)
+            shutil.copy(source, os.path.join(folder, filename))
+
+    with open(os.path.join(folder, 'input'), 'wt') as f:
+        for line in lines:
+            key = line.split('#')[0].split('=')[0].strip()
+            if key == 'sim:minimum-temperature':
+                line = f'sim:minimum-temperature={temperatures[0]:g}\n'
+            elif key == 'sim:maximum-temperature':
+                line = f'sim:maximum-temperature={temperatures[1]:g}\n'
+            f.write(line)
+
+
+def run_chunk(vampire, folder):
+    """
+    Run Vampire in the working directory of a chunk.
+
+    :param vampire: path to the Vampire binary.
+    :param folder: working directory of the chunk.
+    :return: exit code of Vampire.
+    """
+    with open(os.path.join(folder, 'vampire.log'), 'wt') as f:
+        return subprocess.run([vampire], cwd=folder, stdout=f, stderr=subprocess.STDOUT).returncode
+
+
+def merge_outputs(folders, filename='output'):
+    """
+    Merge the output files of all chunks, sorting the data lines by temperature.
+
+    :param folders: working directories of the chunks.
+    :param filename: path to the merged output file.
+    """
+    header = []
+    data = []
+    for i, folder in enumerate(folders):
+        with open(os.path.join(folder, 'output'), 'rt') as f:
+            for line in f:
+                if line.startswith('#') or not line.strip():
+                    if i == 0:
+                        header.append(line)
+                else:
+                    data.append(line)
+
+    data.sort(key=lambda line: float(line.split()[0]))
+    with open(filename, 'wt') as f:
+        f.writelines(header + data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run Vampire in parallel over the temperature range.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of parallel Vampire runs')
+    parser.add_argument('--chunks', type=int, help='number of temperature chunks (default: processes)')
+    parser.add_argument('--vampire', default=os.environ.get('VAMPIRE', 'vampire-serial'),
+                        help='path to the Vampire binary')
+    parser.add_argument('--input', default='vampire_input/input', help='path to the Vampire input file')
+    parser.add_argument('--runs-dir', default='vampire_runs', help='folder for the working directories')
+    args = parser.parse_args()
+
+    lines, keywords = read_input(args.input)
+    chunks = split_temperatures(keywords, args.chunks or args.processes)
+    folders = [os.path.join(args.runs_dir, f'chunk{i:03d}') for i in range(len(chunks))]
+    for folder, temperatures in zip(folders, chunks):
+        write_chunk(folder, lines, keywords, os.path.dirname(args.input), temperatures)
+
+    print(f'Running {len(chunks)} Vampire processes on {args.processes} workers')
+    with multiprocessing.Pool(processes=args.processes) as pool:
+        exit_codes = pool.starmap(run_chunk, [(args.vampire, folder) for folder in folders])
+
+    failed = [folder for folder, exit_code in zip(folders, exit_codes) if exit_code != 0]
+    if failed:
+        raise RuntimeError(f"Vampire failed in {', '.join(failed)}, see vampire.log in these folders.")
+
+    merge_outputs(folders)
+    print('Merged output of all chunks written in output')
@@ -12,3 +12,12 @@ append_coupling_constants = False
 
 # choose the atomic types to be considered magnetic (default transition metals)
 # magnetic_atoms = ['Mn']
+
+# parameters of the built-in Monte Carlo engine 2_run_monte_carlo.py (defaults below)
+# system_size = 5.0             # minimum size of the simulated system along each lattice vector in nm
+# minimum_temperature = 0       # in K
+# maximum_temperature = 1200    # in K
+# temperature_increment = 10    # in K
+# equilibration_steps = 1000    # Monte Carlo steps for equilibration at each temperature
+# loop_steps = 2000             # Monte Carlo steps for averaging at each temperature
+# seed = 1                      # seed of the random number generator, random if not given
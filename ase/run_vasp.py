@@ -17,5 +17,9 @@ import os
 # vasp 5 module
 # exitcode = os.system('module load intel/mkl-11.2.3 mpi/impi-5.0.3 vasp/vasp-5.4.4; mpirun vasp_std')
 
+# number of MPI tasks, set by common/pack_launcher.py when several calculations share the same allocation
+# (make sure that your MPI library does not bind all of them to the same cores)
+ntasks = f"-n {os.environ['AUTOMAG_NTASKS']} " if 'AUTOMAG_NTASKS' in os.environ else ''
+
 # vasp 6 module
-exitcode = os.system('module load vasp/6.1.1; mpirun vasp_std')
+exitcode = os.system(f'module load vasp/6.1.1; mpirun {ntasks}vasp_std')
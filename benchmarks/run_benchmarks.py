@@ -0,0 +1,241 @@
+"""
+automag.benchmarks.run_benchmarks
+=================================
+
+Script which measures time and peak memory of the most expensive Python steps of Automag as a function of
+system size, offline and with synthetic inputs, so that neither VASP nor MongoDB are needed.
+
+The following benchmarks are available:
+
+- `enumeration` runs 2_coll/1_submit.py on the primitive cell of alpha-Fe2O3 for increasing values of
+  `supercell_size`, with the offline launchpad;
+- `coupling` runs 3_monte_carlo/1_coupling_constants.py on supercells of the conventional cell of alpha-Fe2O3
+  with random states;
+- `ucf` runs 3_monte_carlo/2_write_vampire_ucf.py on the same supercells;
+- `outcar` parses synthetic OUTCAR files of supercells of alpha-Fe2O3 with WriteOutputTask and
+  WriteChargesTask.
+
+Each measurement runs in a fresh process in a temporary directory. The modules imported by the scripts
+are loaded before the processes are forked, so that the measurements do not include their import time.
+Time is the best of the repetitions and peak memory is the maximum memory allocated by Python and NumPy during an additional run, measured
+with tracemalloc. Usage:
+
+`python $AUTOMAG_PATH/benchmarks/run_benchmarks.py [--benchmarks NAME ...] [--sizes N ...] [--repeat N]`
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import sys
+import time
+import runpy
+import shutil
+import argparse
+import importlib
+import tempfile
+import contextlib
+import tracemalloc
+import numpy as np
+import multiprocessing
+
+from synthetic import supercell, magnetic_indices, random_states, write_outcar, write_oszicar
+
+AUTOMAG_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules imported by the benchmarked scripts, loaded once in the parent process
+PRELOADED_MODULES = ['matplotlib.pyplot', 'matplotlib.ticker', 'scipy.sparse', 'pymatgen.core.structure',
+                     'pymatgen.symmetry.analyzer', 'pymatgen.io.vasp', 'common.enumeration',
+                     'common.SubmitFirework', 'common.heisenberg', 'common.utilities']
+
+
+def run_script(folder, script):
+    """
+    Run a script of Automag as if it was launched from its folder.
+
+    :param folder: folder containing the script and its input.py file.
+    :param script: name of the script.
+    """
+    os.chdir(folder)
+    sys.path.insert(0, folder)
+    sys.modules.pop('input', None)
+    try:
+        runpy.run_path(os.path.join(folder, script), run_name='__main__')
+    except SystemExit:
+        pass
+
+
+def setup_enumeration(workdir, size):
+    os.makedirs(os.path.join(workdir, 'geometries'))
+    os.makedirs(os.path.join(workdir, 'CalcFold'))
+    os.makedirs(os.path.join(workdir, '2_coll'))
+    shutil.copy(os.path.join(AUTOMAG_PATH, 'geometries', 'Fe2O3-alpha_primitive.vasp'),
+                os.path.join(workdir, 'geometries'))
+    shutil.copy(os.path.join(AUTOMAG_PATH, '2_coll', '1_submit.py'), os.path.join(workdir, '2_coll'))
+    with open(os.path.join(workdir, '2_coll', 'input.py'), 'wt') as f:
+        f.write("poscar_file = 'Fe2O3-alpha_primitive.vasp'\n")
+        f.write(f"supercell_size = {size}\n")
+        f.write("spin_values = {'Fe': [4]}\n")
+        f.write("params = {'encut': 500, 'kpts': 20}\n")
+
+    os.environ['AUTOMAG_PATH'] = workdir
+    os.environ['AUTOMAG_LAUNCHPAD'] = 'offline'
+    return lambda: run_script(os.path.join(workdir, '2_coll'), '1_submit.py')
+
+
+def setup_monte_carlo(workdir, size):
+    structure = supercell('Fe2O3-alpha_conventional.vasp', size)
+    indices = magnetic_indices(structure)
+    states, energies = random_states(len(indices), 20 * len(indices) + 20)
+
+    os.makedirs(os.path.join(workdir, '2_coll', 'trials'))
+    os.makedirs(os.path.join(workdir, '3_monte_carlo'))
+    structure.to(filename=os.path.join(workdir, '2_coll', 'setting001.vasp'), fmt='poscar')
+    structure.to(filename=os.path.join(workdir, '2_coll', 'trials', 'setting001.vasp'), fmt='poscar')
+    with open(os.path.join(workdir, '2_coll', 'states001.txt'), 'wt') as f:
+        f.write(str(states))
+    with open(os.path.join(workdir, '2_coll', 'energies001.txt'), 'wt') as f:
+        f.write(str(energies))
+    with open(os.path.join(workdir, '2_coll', 'trials', 'configurations001.txt'), 'wt') as f:
+        f.write(f"{'afm1':>6s}    1  " + ' '.join(f'{spin:2d}' for spin in states[1]) + '\n')
+
+    for script in ['1_coupling_constants.py', '2_write_vampire_ucf.py']:
+        shutil.copy(os.path.join(AUTOMAG_PATH, '3_monte_carlo', script), os.path.join(workdir, '3_monte_carlo'))
+    with open(os.path.join(workdir, '3_monte_carlo', 'input.py'), 'wt') as f:
+        f.write("configuration = 'afm1'\n")
+        f.write("cutoff_radius = 6.0\n")
+        f.write("control_group_size = 0.4\n")
+        f.write("append_coupling_constants = False\n")
+        f.write("distances_between_neighbors = [2.9, 3.0, 3.6, 4.1, 5.0, 5.2, 5.5, 5.9]\n")
+        f.write("coupling_constants = [1e-21, -2e-21, 3e-22, -4e-22, 5e-22, -6e-22, 7e-22, -8e-22]\n")
+
+    return os.path.join(workdir, '3_monte_carlo')
+
+
+def setup_coupling(workdir, size):
+    folder = setup_monte_carlo(workdir, size)
+    os.environ['MPLBACKEND'] = 'Agg'
+    return lambda: run_script(folder, '1_coupling_constants.py')
+
+
+def setup_ucf(workdir, size):
+    folder = setup_monte_carlo(workdir, size)
+    return lambda: run_script(folder, '2_write_vampire_ucf.py')
+
+
+def setup_outcar(workdir, size):
+    from pymatgen.io.vasp import Poscar
+    from common.utilities import WriteOutputTask, WriteChargesTask
+
+    structure = supercell('Fe2O3-alpha_primitive.vasp', size)
+    magmoms = np.where([site.specie.symbol == 'Fe' for site in structure], 4.0, 0.0)
+    magmoms[::2] *= -1
+
+    # the first Fe atom is replaced by a dummy atom for WriteChargesTask
+    dummy_structure = structure.copy()
+    dummy_structure.replace(0, 'Zn')
+    dummy_structure = dummy_structure.get_sorted_structure(key=lambda site: site.specie.symbol != 'Zn')
+
+    job_info = []
+    for name in ['singlepoint', 'recalc', 'nsc']:
+        launch_dir = os.path.join(workdir, name)
+        os.makedirs(launch_dir)
+        write_outcar(os.path.join(launch_dir, 'OUTCAR'), structure, magmoms, ionic_steps=1)
+        write_oszicar(os.path.join(launch_dir, 'OSZICAR'))
+        # the first line of the POSCAR file lists the species, as written by ASE
+        comment = ' '.join(element.symbol for element in dummy_structure.composition.elements)
+        Poscar(dummy_structure, comment=comment).write_file(os.path.join(launch_dir, 'POSCAR'))
+        with open(os.path.join(launch_dir, 'INCAR'), 'wt') as f:
+            f.write('MAGMOM = ' + ' '.join(str(item) for item in magmoms) + '\n')
+        with open(os.path.join(launch_dir, 'is_converged'), 'wt') as f:
+            f.write('converged')
+        job_info.append({'name': name, 'launch_dir': launch_dir, 'fw_id': len(job_info) + 1})
+
+    os.makedirs(os.path.join(workdir, 'CalcFold'))
+    os.environ['AUTOMAG_PATH'] = workdir
+    output_task = WriteOutputTask(system='afm1', material='Fe2O3', mode='singlepoint', read_enthalpy=False,
+                                  energy_convergence=True, initial_magmoms=magmoms.tolist())
+    charges_task = WriteChargesTask(material='Fe2O3', pert_value=0.05, dummy_atom='Zn')
+
+    def run():
+        output_task.run_task({'_job_info': job_info[:2]})
+        charges_task.run_task({'_job_info': job_info})
+
+    return run
+
+
+def n_magnetic(size):
+    return len(magnetic_indices(supercell('Fe2O3-alpha_conventional.vasp', size)))
+
+
+def n_atoms(size):
+    return len(supercell('Fe2O3-alpha_primitive.vasp', size))
+
+
+# name: (setup function, function giving the system size, unit of the system size)
+BENCHMARKS = {
+    'enumeration': (setup_enumeration, lambda size: size, 'supercell_size'),
+    'coupling': (setup_coupling, n_magnetic, 'magnetic atoms'),
+    'ucf': (setup_ucf, n_magnetic, 'magnetic atoms'),
+    'outcar': (setup_outcar, n_atoms, 'atoms'),
+}
+
+
+def child(setup, size, trace, connection):
+    """
+    Prepare and run a benchmark in a temporary directory, sending back time and peak memory.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        run = setup(workdir, size)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else 0
+        os.chdir(AUTOMAG_PATH)
+    connection.send((elapsed, peak))
+
+
+def measure(setup, size, repeat):
+    """
+    Measure a benchmark in fresh processes.
+
+    :param setup: function which prepares the benchmark in a directory and returns the function to measure.
+    :param size: size of the system.
+    :param repeat: number of timed repetitions.
+    :return: tuple with the best time in seconds and the peak memory in MB.
+    """
+    context = multiprocessing.get_context('fork')
+    results = []
+    for trace in [False] * repeat + [True]:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=child, args=(setup, size, trace, sender))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f'benchmark failed with exit code {process.exitcode}')
+        results.append(receiver.recv())
+
+    return min(elapsed for elapsed, _ in results[:-1]), results[-1][1] / 1024 ** 2
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks of Automag.')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 2, 3],
+                        help='supercell sizes, i.e. repetitions of the unit cell along each lattice vector')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed repetitions')
+    args = parser.parse_args()
+
+    sys.path.insert(0, AUTOMAG_PATH)
+    os.environ['MPLBACKEND'] = 'Agg'
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+
+    print(f"{'benchmark':>12s} {'size':>5s} {'system size':>22s} {'time (s)':>10s} {'peak (MB)':>10s}")
+    for name in args.benchmarks:
+        setup, system_size, unit = BENCHMARKS[name]
+        for size in args.sizes:
+            elapsed, peak = measure(setup, size, args.repeat)
+            print(f"{name:>12s} {size:5d} {f'{system_size(size)} {unit}':>22s} {elapsed:10.3f} {peak:10.1f}")
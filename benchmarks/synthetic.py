@@ -0,0 +1,139 @@
+"""
+automag.benchmarks.synthetic
+============================
+
+Functions which generate synthetic inputs for the benchmarks: supercells of the geometries shipped with
+Automag, magnetic configurations with their energies and VASP output files.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import numpy as np
+
+from pymatgen.core.structure import Structure
+
+GEOMETRIES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geometries')
+
+
+def supercell(poscar_file, size):
+    """
+    Supercell of a shipped geometry, with atoms sorted by species as in VASP.
+
+    :param poscar_file: name of the file in the geometries folder.
+    :param size: number of repetitions of the unit cell along each lattice vector.
+    :return: pymatgen Structure object.
+    """
+    structure = Structure.from_file(os.path.join(GEOMETRIES, poscar_file))
+    structure.make_supercell([size, size, size])
+    return structure.get_sorted_structure(key=lambda site: structure.composition.elements.index(site.specie))
+
+
+def magnetic_indices(structure):
+    """
+    Indices of the transition metal atoms of a structure.
+
+    :param structure: pymatgen Structure object.
+    :return: list of indices.
+    """
+    return [i for i, site in enumerate(structure) if site.specie.is_transition_metal]
+
+
+def random_states(n_magnetic, n_states, seed=0):
+    """
+    Random collinear magnetic states of the magnetic atoms, with random energies.
+
+    :param n_magnetic: number of magnetic atoms.
+    :param n_states: number of states.
+    :param seed: seed of the random number generator.
+    :return: tuple with the list of states, each one a list of +1 and -1, and the list of energies in eV/atom.
+    """
+    rng = np.random.default_rng(seed)
+    states = rng.choice([-1, 1], size=(n_states, n_magnetic))
+    states[:, 0] = 1
+    energies = -7 + 0.01 * rng.standard_normal(n_states)
+    return states.tolist(), energies.tolist()
+
+
+def write_outcar(filename, structure, magmoms, ionic_steps=1, electronic_steps=30, cores=16):
+    """
+    Write a synthetic OUTCAR file containing all the blocks read by Automag.
+
+    :param filename: path to the file.
+    :param structure: pymatgen Structure object, sorted by species.
+    :param magmoms: final magnetic moments.
+    :param ionic_steps: number of ionic steps.
+    :param electronic_steps: number of electronic steps of each ionic step.
+    :param cores: number of cores reported in the file.
+    """
+    species = [element.symbol for element in structure.composition.elements]
+    counts = [int(structure.composition[element]) for element in structure.composition.elements]
+    n_atoms = len(structure)
+    rng = np.random.default_rng(0)
+
+    lines = [' vasp.6.1.1 18Jan20 (build Feb 24 2020) complex\n', f' running on   {cores} total cores\n']
+    for symbol in species:
+        lines.append(f'   VRHFIN ={symbol}: d s\n   TITEL  = PAW_PBE {symbol} 06Sep2000\n')
+        lines.append('  kinetic energy error for atom=    0.0012 (will be added to EATOM!!)\n')
+    lines.append(f'   number of dos      NEDOS =    301   number of ions     NIONS = {n_atoms:6d}\n')
+    lines.append('   ions per type =  ' + ' '.join(f'{count:4d}' for count in counts) + '\n')
+    lines.append(f'   k-points           NKPTS =     20   k-points in BZ     NKDIM =     20   '
+                 f'number of bands    NBANDS= {4 * n_atoms:6d}\n')
+
+    for step in range(ionic_steps):
+        energy = -7.0 * n_atoms - 0.01 * step
+        for iteration in range(electronic_steps):
+            lines.append(f'--------------------------------------- Iteration {step + 1:6d}({iteration + 1:4d})'
+                         f'  ---------------------------------------\n\n')
+            lines.append(f'  free energy    TOTEN  = {energy + 1 / (iteration + 1):18.8f} eV\n\n')
+            lines.append(f'  energy without entropy = {energy:18.8f}  energy(sigma->0) = {energy:18.8f}\n\n')
+
+        lines.append(' direct lattice vectors                 reciprocal lattice vectors\n')
+        reciprocal_vectors = structure.lattice.reciprocal_lattice_crystallographic.matrix
+        for vector, reciprocal in zip(structure.lattice.matrix, reciprocal_vectors):
+            lines.append(f'  {vector[0]:12.9f} {vector[1]:12.9f} {vector[2]:12.9f}   '
+                         f'{reciprocal[0]:12.9f} {reciprocal[1]:12.9f} {reciprocal[2]:12.9f}\n')
+
+        lines.append('\n POSITION                                       TOTAL-FORCE (eV/Angst)\n')
+        lines.append(' ' + '-' * 83 + '\n')
+        for coords in structure.cart_coords:
+            force = 0.01 * rng.standard_normal(3)
+            lines.append(f'  {coords[0]:12.5f} {coords[1]:12.5f} {coords[2]:12.5f}   '
+                         f'{force[0]:13.6f} {force[1]:13.6f} {force[2]:13.6f}\n')
+        lines.append(' ' + '-' * 83 + '\n')
+
+        for header, values in [('total charge', np.full(n_atoms, 6.5)), ('magnetization (x)', magmoms)]:
+            lines.append(f'\n {header}\n\n# of ion       s       p       d       tot\n')
+            lines.append('-' * 42 + '\n')
+            for i, value in enumerate(values):
+                lines.append(f'{i + 1:7d}        0.012   0.015 {value - 0.027:7.3f} {value:8.3f}\n')
+            lines.append('-' * 42 + '\n')
+            lines.append(f'tot            0.000   0.000 {np.sum(values):7.3f} {np.sum(values):8.3f}\n\n')
+
+        lines.append('  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n')
+        lines.append(f'  free  energy   TOTEN  = {energy:18.8f} eV\n\n')
+        lines.append(f'  energy  without entropy= {energy:18.8f}  energy(sigma->0) = {energy:18.8f}\n')
+
+    lines.append(' General timing and accounting informations for this job:\n')
+    lines.append(f'                         Elapsed time (sec): {100.0 * ionic_steps:12.3f}\n')
+    lines.append(f'                   Maximum memory used (kb): {1000.0 * n_atoms:12.0f}.\n')
+
+    with open(filename, 'wt') as f:
+        f.writelines(lines)
+
+
+def write_oszicar(filename, ionic_steps=1, electronic_steps=30):
+    """
+    Write a synthetic OSZICAR file.
+
+    :param filename: path to the file.
+    :param ionic_steps: number of ionic steps.
+    :param electronic_steps: number of electronic steps of each ionic step.
+    """
+    with open(filename, 'wt') as f:
+        f.write('       N       E                     dE             d eps       ncg     rms          rms(c)\n')
+        for step in range(ionic_steps):
+            for iteration in range(electronic_steps):
+                f.write(f'DAV: {iteration + 1:3d}    -0.532193123323E+02   -0.35206E+02   -0.91876E+01  2048   '
+                        f'0.482E+01\n')
+            f.write(f'{step + 1:4d} F= -.53219312E+02 E0= -.53219312E+02  d E =-.532193E+02  mag=     2.0000\n')
@@ -13,21 +13,19 @@ from copy import copy
 from ase.io import read
 from typing import Union
 from itertools import product
-from fireworks import LaunchPad, Firework, Workflow
+from fireworks import Firework, Workflow
 
+from common.launchpad import get_launchpad
+from common.cost import estimate_cost, estimate_resources, core_seconds_per_cost
 from common.utilities import atoms_to_encode, VaspCalculationTask, WriteOutputTask, WriteChargesTask
 
 
-# substitute with your launchpad file
-# launchpad = LaunchPad.from_file('/home/michele/.fireworks/my_launchpad.yaml')
-launchpad = LaunchPad.from_file('/home/mgalasso/.fireworks/my_launchpad.yaml')
-
-
 class SubmitFirework(object):
-    def __init__(self, poscar_file: str, mode: str, fix_params: dict, magmoms: list,
+    def __init__(self, poscar_file: str, mode: str, fix_params: dict, magmoms: list = None,
                  encut_values: Union[list, range] = None, sigma_values: Union[list, range] = None,
                  kpts_values: Union[list, range] = None, pert_values: Union[list, range] = None,
-                 name: str = None, dummy_atom: str = None, dummy_position: int = None):
+                 name: str = None, dummy_atom: str = None, dummy_position: int = None, warm_start: bool = False,
+                 skip_recalc: bool = False):
         if mode == 'encut':
             assert encut_values is not None
             assert sigma_values is None
@@ -63,12 +61,16 @@ class SubmitFirework(object):
         else:
             raise ValueError(f'Value of mode = {mode} not understood.')
 
+        # the recalc run can be skipped only when the workflow ends with write_output
+        if skip_recalc:
+            assert mode == 'singlepoint'
+
         if mode == 'encut':
             self.energy_convergence = True
         else:
             self.energy_convergence = False
 
-        self.magmoms = np.array(magmoms)
+        self.magmoms = None if magmoms is None else np.array(magmoms)
         self.mode = mode
         self.fix_params = fix_params
         self.poscar_file = poscar_file
@@ -76,11 +78,16 @@ class SubmitFirework(object):
         self.pert_values = pert_values
         self.dummy_atom = dummy_atom
         self.dummy_position = dummy_position
+        self.warm_start = warm_start
+        self.skip_recalc = skip_recalc
+        self.structure = None
+        self.scale = None
 
     def submit(self):
-        params = copy(self.fix_params)
+        workflows = []
         if self.var_params:
             for values in self.var_params:
+                params = copy(self.fix_params)
                 if len(values) == 1:
                     if self.mode == 'encut':
                         params['encut'] = values[0]
@@ -95,24 +102,67 @@ class SubmitFirework(object):
                 else:
                     raise ValueError('Convergence tests for three parameters simultaneously are not supported.')
 
-                self.add_wflow(params, name)
+                workflows.append(self.get_wflow(params, name))
         else:
+            params = copy(self.fix_params)
             if self.name is not None:
-                self.add_wflow(params, f'{self.name}')
+                workflows.append(self.get_wflow(params, f'{self.name}'))
             else:
-                self.add_wflow(params, self.mode)
+                workflows.append(self.get_wflow(params, self.mode))
+
+        get_launchpad().bulk_add_wfs(workflows)
+
+    def submit_configurations(self, configurations, names):
+        """
+        Submit one singlepoint workflow for each magnetic configuration with a single bulk insert.
+
+        :param configurations: list of magnetic configurations, one value for each atom.
+        :param names: list with the name of each configuration.
+        """
+        assert self.mode == 'singlepoint'
+
+        workflows = []
+        for magmoms, name in zip(configurations, names):
+            workflows.append(self.get_wflow(copy(self.fix_params), name, magmoms=np.array(magmoms)))
+
+        get_launchpad().bulk_add_wfs(workflows)
+
+    def read_structure(self):
+        """
+        Read and encode the input structure only once for all workflows.
+
+        :return: tuple with the ase Atoms object, the encoded structure, its empirical chemical formula and the
+            chemical symbol of the atom replaced by the dummy atom in perturbations mode (None in all other modes).
+        """
+        if self.structure is None:
+            atoms = read(self.poscar_file)
+            material = atoms.get_chemical_formula(mode='metal', empirical=True)
+            atom_ucalc = None
+            if self.mode == 'perturbations':
+                ch_symbols = atoms.get_chemical_symbols()
+                atom_ucalc = ch_symbols[self.dummy_position]
+                ch_symbols[self.dummy_position] = self.dummy_atom
+                atoms.set_chemical_symbols(ch_symbols)
+
+            self.structure = (atoms, atoms_to_encode(atoms), material, atom_ucalc)
+
+        return self.structure
+
+    def get_wflow(self, params, name, magmoms=None):
+        if magmoms is None:
+            magmoms = self.magmoms
 
-    def add_wflow(self, params, name):
         # create an atoms object and encode it
-        atoms = read(self.poscar_file)
-        if self.mode == 'perturbations':
-            ch_symbols = atoms.get_chemical_symbols()
-            atom_ucalc = ch_symbols[self.dummy_position]
-            ch_symbols[self.dummy_position] = self.dummy_atom
-            atoms.set_chemical_symbols(ch_symbols)
-            encode = atoms_to_encode(atoms)
-        else:
-            encode = atoms_to_encode(atoms)
+        atoms, encode, material, atom_ucalc = self.read_structure()
+
+        # request resources according to the estimated cost, and start the most expensive calculations first
+        if self.scale is None:
+            self.scale = core_seconds_per_cost()
+        cost = estimate_cost(atoms, params, ispin=2 if np.any(magmoms) else 1)
+        resources = estimate_resources(cost, params.get('ncore', 1), self.scale)
+        vasp_spec = {'_pass_job_info': True, 'cost': cost, **resources,
+                     'telemetry': {'material': material, 'mode': self.mode, 'state': name}}
+        output_spec = {'_queueadapter': {'ntasks': 1, 'walltime': '00:30:00'}, '_priority': resources['_priority']}
 
         # here we will collect all fireworks of our workflow
         fireworks = []
@@ -122,42 +172,65 @@ class SubmitFirework(object):
             sp_firetask = VaspCalculationTask(
                 calc_params=params,
                 encode=encode,
-                magmoms=self.magmoms,
+                magmoms=magmoms,
             )
             sp_firework = Firework(
                 [sp_firetask],
                 name='singlepoint',
-                spec={'_pass_job_info': True},
+                spec=vasp_spec,
                 fw_id=1
             )
             fireworks.append([sp_firework])
         else:
-            # single-point run
-            sp_firetask = VaspCalculationTask(
-                calc_params=params,
-                encode=encode,
-                magmoms=self.magmoms,
-            )
-            sp_firework = Firework(
-                [sp_firetask],
-                name='singlepoint',
-                spec={'_pass_job_info': True},
-                fw_id=0
-            )
-            fireworks.append([sp_firework])
+            # keep wavefunctions and charge density of the single-point run to restart the recalc run from them
+            sp_params = copy(params)
+            if self.warm_start:
+                sp_params['lwave'] = True
+                sp_params['lcharg'] = True
 
-            # recalc run with magmoms from previous run
-            recalc_firetask = VaspCalculationTask(
-                calc_params=params,
-                magmoms='previous',
-            )
-            recalc_firework = Firework(
-                [recalc_firetask],
-                name='recalc',
-                spec={'_pass_job_info': True},
-                fw_id=1,
-            )
-            fireworks.append([recalc_firework])
+            if self.skip_recalc:
+                # single-point run, which adds the recalc run to the workflow only if the magmoms change
+                sp_firetask = VaspCalculationTask(
+                    calc_params=sp_params,
+                    encode=encode,
+                    magmoms=magmoms,
+                    recalc={'calc_params': params, 'warm_start': self.warm_start},
+                )
+                sp_firework = Firework(
+                    [sp_firetask],
+                    name='singlepoint',
+                    spec=vasp_spec,
+                    fw_id=1
+                )
+                fireworks.append([sp_firework])
+            else:
+                # single-point run
+                sp_firetask = VaspCalculationTask(
+                    calc_params=sp_params,
+                    encode=encode,
+                    magmoms=magmoms,
+                )
+                sp_firework = Firework(
+                    [sp_firetask],
+                    name='singlepoint',
+                    spec=vasp_spec,
+                    fw_id=0
+                )
+                fireworks.append([sp_firework])
+
+                # recalc run with magmoms from previous run
+                recalc_firetask = VaspCalculationTask(
+                    calc_params=params,
+                    magmoms='previous',
+                    warm_start=self.warm_start,
+                )
+                recalc_firework = Firework(
+                    [recalc_firetask],
+                    name='recalc',
+                    spec=vasp_spec,
+                    fw_id=1,
+                )
+                fireworks.append([recalc_firework])
 
         if self.mode == 'perturbations':
             next_id = 2
@@ -168,7 +241,7 @@ class SubmitFirework(object):
                 nsc_firetask = VaspCalculationTask(
                     calc_params=params,
                     encode=encode,
-                    magmoms=self.magmoms,
+                    magmoms=magmoms,
                     pert_step='NSC',
                     pert_value=perturbation,
                     dummy_atom=self.dummy_atom,
@@ -178,7 +251,7 @@ class SubmitFirework(object):
                 nsc_firework = Firework(
                     [nsc_firetask],
                     name='nsc',
-                    spec={'_pass_job_info': True},
+                    spec=vasp_spec,
                     fw_id=next_id,
                 )
 
@@ -188,7 +261,7 @@ class SubmitFirework(object):
                 sc_firetask = VaspCalculationTask(
                     calc_params=params,
                     encode=encode,
-                    magmoms=self.magmoms,
+                    magmoms=magmoms,
                     pert_step='SC',
                     pert_value=perturbation,
                     dummy_atom=self.dummy_atom,
@@ -198,7 +271,7 @@ class SubmitFirework(object):
                 sc_firework = Firework(
                     [sc_firetask],
                     name='sc',
-                    spec={'_pass_job_info': True},
+                    spec=vasp_spec,
                     fw_id=next_id,
                 )
 
@@ -206,14 +279,14 @@ class SubmitFirework(object):
                 next_id += 1
 
                 out_firetask = WriteChargesTask(
-                    filename='charges.txt',
+                    material=material,
                     pert_value=perturbation,
                     dummy_atom=self.dummy_atom,
                 )
                 out_firework = Firework(
                     [out_firetask],
                     name='write_charges',
-                    spec={'_queueadapter': {'ntasks': 1, 'walltime': '00:30:00'}},
+                    spec=output_spec,
                     fw_id=next_id,
                 )
 
@@ -227,15 +300,16 @@ class SubmitFirework(object):
             # write output
             output_firetask = WriteOutputTask(
                 system=name,
-                filename=f"{atoms.get_chemical_formula(mode='metal', empirical=True)}_{self.mode}.txt",
-                initial_magmoms=self.magmoms,
+                material=material,
+                mode=self.mode,
+                initial_magmoms=magmoms,
                 read_enthalpy=False,
                 energy_convergence=self.energy_convergence,
             )
             output_firework = Firework(
                 [output_firetask],
                 name='write_output',
-                spec={'_queueadapter': {'ntasks': 1, 'walltime': '00:30:00'}},
+                spec=output_spec,
                 fw_id=2,
             )
             fireworks.append([output_firework])
@@ -255,5 +329,4 @@ class SubmitFirework(object):
                 for j, fw in enumerate(level):
                     links_dict[fw.fw_id] = [next_level[j].fw_id]
 
-        workflow = Workflow(flat_fireworks, name=name, links_dict=links_dict)
-        launchpad.add_wf(workflow)
+        return Workflow(flat_fireworks, name=name, links_dict=links_dict)
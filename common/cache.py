@@ -0,0 +1,202 @@
+"""
+automag.common.cache
+====================
+
+Functions which cache the outputs of VASP calculations, so that a calculation which has already been run
+with the same structure, magnetic moments and parameters is not run again.
+
+Each calculation is identified by a hash of its inputs and its outputs are stored in a folder named after
+the hash. An index keeps track of the size, of the files and of the last use of each folder, and the least
+recently used folders are removed when the cache grows beyond a maximum size. Files are stored with
+reflinks or hardlinks when possible, so that the cache does not take additional disk space as long as the
+launch directories exist. WAVECAR and CHGCAR are stored only in this case, since copying them would cost
+more than it saves.
+
+Files are staged into a temporary folder which is then renamed into place, and evicted folders are renamed
+before being removed, so that the lock on the index is only held while the index is read and updated.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+from common.staging import stage_file
+
+# substitute with the maximum size of the cache in GB, 0 disables the cache
+CACHE_SIZE_GB = 0
+
+# files which are stored for each calculation, if present
+CACHED_FILES = ['INCAR', 'POSCAR', 'KPOINTS', 'OUTCAR', 'CONTCAR', 'OSZICAR', 'is_converged']
+
+# large files which are stored only if they can be linked instead of copied
+LINKED_FILES = ['WAVECAR', 'CHGCAR']
+
+# VASP parameters which do not change the results of a calculation
+IGNORED_PARAMS = ['ncore', 'npar', 'kpar', 'nsim', 'lplane']
+
+
+def cache_dir():
+    """
+    Path to the folder containing the cache.
+
+    :return: path to the cache folder.
+    """
+    return os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold', 'cache')
+
+
+def calculation_key(encode, magmoms, calc_params, parent_key=None):
+    """
+    Hash of the inputs of a VASP calculation.
+
+    :param encode: encoded structure.
+    :param magmoms: initial magnetic moments.
+    :param calc_params: VASP parameters as given to the ASE calculator.
+    :param parent_key: key of the calculation whose output files are used as input, if any.
+    :return: hexadecimal string.
+    """
+    params = {}
+    for key, value in calc_params.items():
+        if key.lower() not in IGNORED_PARAMS:
+            if isinstance(value, list):
+                value = np.asarray(value)
+            params[key.lower()] = value.tolist() if hasattr(value, 'tolist') else value
+
+    data = {
+        'encode': json.loads(encode),
+        'magmoms': np.round(magmoms, 6).tolist(),
+        'calc_params': params,
+        'parent_key': parent_key,
+    }
+
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def read_cache_key(launch_dir):
+    """
+    Read the key of the calculation run in a launch directory.
+
+    :param launch_dir: launch directory of the calculation.
+    :return: key of the calculation, None if it is not known.
+    """
+    try:
+        with open(os.path.join(launch_dir, 'cache_key'), 'rt') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def update_index(update):
+    """
+    Read and modify the index of the cache while holding an exclusive lock on it.
+
+    :param update: function which takes the index, a dictionary from keys to dictionaries with 'size',
+        'files' and 'last_used', and modifies it in place.
+    """
+    os.makedirs(cache_dir(), exist_ok=True)
+    with open(os.path.join(cache_dir(), 'index.json'), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read()
+            index = json.loads(content) if content else {}
+            update(index)
+            f.seek(0)
+            f.truncate()
+            json.dump(index, f)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def restore_calculation(key, required=()):
+    """
+    Copy the outputs of a cached calculation into the current directory.
+
+    :param key: key of the calculation.
+    :param required: large files, e.g. 'WAVECAR', which must be among the outputs, because a later run
+        reads them.
+    :return: True if the calculation was found in the cache.
+    """
+    if CACHE_SIZE_GB == 0:
+        return False
+
+    folder = os.path.join(cache_dir(), key)
+    filenames = []
+
+    def touch(index):
+        if key in index and os.path.isdir(folder) and set(required).issubset(index[key].get('files', [])):
+            index[key]['last_used'] = time.time()
+            filenames.extend(index[key].get('files', os.listdir(folder)))
+
+    update_index(touch)
+    if not filenames:
+        return False
+
+    # the folder may be evicted by another process meanwhile, in which case the calculation is run again
+    try:
+        for filename in filenames:
+            stage_file(os.path.join(folder, filename), filename, read_only=True, symlink=False)
+    except FileNotFoundError:
+        for filename in filenames:
+            if os.path.lexists(filename):
+                os.remove(filename)
+        return False
+
+    return True
+
+
+def store_calculation(key):
+    """
+    Store the outputs of the calculation in the current directory and evict the least recently used
+    calculations if the cache is too large.
+
+    :param key: key of the calculation.
+    """
+    if CACHE_SIZE_GB == 0:
+        return
+
+    os.makedirs(cache_dir(), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=cache_dir())
+    files = []
+    size = 0
+    for filename in CACHED_FILES + LINKED_FILES:
+        if os.path.isfile(filename):
+            method, _ = stage_file(filename, os.path.join(staging, filename), read_only=True, symlink=False,
+                                   copy=filename not in LINKED_FILES)
+            if method is not None:
+                files.append(filename)
+                size += os.path.getsize(filename)
+
+    # folders to remove once the lock is released
+    removed = []
+
+    def store(index):
+        folder = os.path.join(cache_dir(), key)
+        if os.path.isdir(folder):
+            removed.append(f'{staging}-{key}')
+            os.rename(folder, removed[-1])
+        os.rename(staging, folder)
+        index[key] = {'size': size, 'files': files, 'last_used': time.time()}
+
+        # evict least recently used calculations
+        total = sum(item['size'] for item in index.values())
+        for old_key in sorted(index, key=lambda item: index[item]['last_used']):
+            if total <= CACHE_SIZE_GB * 1024 ** 3 or old_key == key:
+                break
+            if os.path.isdir(os.path.join(cache_dir(), old_key)):
+                removed.append(f'{staging}-{old_key}')
+                os.rename(os.path.join(cache_dir(), old_key), removed[-1])
+            total -= index.pop(old_key)['size']
+
+    try:
+        update_index(store)
+    finally:
+        for folder in [staging] + removed:
+            shutil.rmtree(folder, ignore_errors=True)
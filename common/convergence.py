@@ -0,0 +1,188 @@
+"""
+automag.common.convergence
+==========================
+
+Functions which schedule convergence tests adaptively, submitting only the calculations which are needed
+to find the first value of a parameter giving an error below a given tolerance.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import time
+
+from common.launchpad import get_launchpad, OfflineLaunchPad
+
+
+def coarse_indices(n_values, stride):
+    """
+    Indices of a coarse grid over a sorted list of trial values, always including the last one.
+
+    :param n_values: number of trial values.
+    :param stride: distance between consecutive indices of the coarse grid.
+    :return: list of indices.
+    """
+    indices = list(range(0, n_values, stride))
+    if indices[-1] != n_values - 1:
+        indices.append(n_values - 1)
+
+    return indices
+
+
+def refine(energies, n_values, tolerance=0.001):
+    """
+    Decide which trial values to compute next, bisecting between the last value which is not converged and
+    the first value from which all computed values are within tolerance of the most accurate one.
+
+    :param energies: dictionary from indices of computed trial values to energies per atom, which must contain
+        the last index.
+    :param n_values: number of trial values.
+    :param tolerance: maximum error in eV/atom w.r.t. the most accurate result.
+    :return: tuple with the index of the first converged value (None if not yet known) and the list of
+        indices to compute next (empty if the converged value has been found).
+    """
+    reference = energies[n_values - 1]
+
+    # first index from which all computed values, including the following ones, are within tolerance
+    first_converged = n_values - 1
+    for index in sorted(energies, reverse=True):
+        if abs(energies[index] - reference) >= tolerance:
+            break
+        first_converged = index
+
+    # last computed index which is not converged, -1 if none
+    last_not_converged = max([index for index in energies if index < first_converged], default=-1)
+
+    if first_converged - last_not_converged == 1:
+        return first_converged, []
+    else:
+        return None, [(last_not_converged + first_converged + 1) // 2]
+
+
+def failed_states(material, mode, states, since):
+    """
+    Find the states whose VASP fireworks have fizzled or have been defused, so that their results will never
+    be written.
+
+    :param material: empirical chemical formula of the material.
+    :param mode: calculation mode, e.g. 'encut' or 'kgrid'.
+    :param states: names of the states to check.
+    :param since: datetime, fireworks which have not been updated after it are ignored, so that failures of
+        previous submissions of the same states do not count.
+    :return: set of names of the failed states.
+    """
+    launchpad = get_launchpad()
+    if isinstance(launchpad, OfflineLaunchPad):
+        return set()
+
+    query = {
+        'state': {'$in': ['FIZZLED', 'DEFUSED']},
+        'updated_on': {'$gte': since},
+        'spec.telemetry.material': material,
+        'spec.telemetry.mode': mode,
+        'spec.telemetry.state': {'$in': list(states)},
+    }
+    return {fw['spec']['telemetry']['state'] for fw in launchpad.fireworks.find(query, {'spec.telemetry.state': 1})}
+
+
+def pending_states(material, mode, states):
+    """
+    Find the states whose VASP fireworks have been submitted and have not finished yet, for example by a
+    previous run of the same script which has been interrupted, so that they are not submitted again.
+
+    :param material: empirical chemical formula of the material.
+    :param mode: calculation mode, e.g. 'encut' or 'kgrid'.
+    :param states: names of the states to check.
+    :return: set of names of the pending states.
+    """
+    launchpad = get_launchpad()
+    if isinstance(launchpad, OfflineLaunchPad):
+        return set()
+
+    query = {
+        'state': {'$in': ['WAITING', 'READY', 'RESERVED', 'RUNNING', 'PAUSED']},
+        'spec.telemetry.material': material,
+        'spec.telemetry.mode': mode,
+        'spec.telemetry.state': {'$in': list(states)},
+    }
+    return {fw['spec']['telemetry']['state'] for fw in launchpad.fireworks.find(query, {'spec.telemetry.state': 1})}
+
+
+def wait_for_results(read, states, poll_interval=60, timeout=None, failed=None):
+    """
+    Wait until results have been written for all given states.
+
+    :param read: function without arguments which returns the list of result records.
+    :param states: names of the states to wait for.
+    :param poll_interval: seconds between two consecutive checks.
+    :param timeout: maximum number of seconds to wait, no limit if None.
+    :param failed: function which takes the names of the states without results and returns those whose
+        calculations have failed, so that their results will never be written.
+    :return: dictionary from each state to its last result record.
+    """
+    start = time.time()
+    while True:
+        try:
+            records = {record['state']: record for record in read()}
+        except FileNotFoundError:
+            records = {}
+
+        missing = [state for state in states if state not in records]
+        if not missing:
+            return records
+
+        failures = set() if failed is None else failed(missing)
+        if failures:
+            raise RuntimeError(f"The calculation(s) {', '.join(sorted(failures))} failed, check the fizzled or "
+                               f"defused fireworks and run this script again.")
+
+        if timeout is not None and time.time() - start > timeout:
+            raise TimeoutError(f"No results after {timeout} seconds for {len(missing)} calculation(s): "
+                               f"{', '.join(missing)}")
+
+        print(f"Waiting for {len(missing)} calculation(s): {', '.join(missing)}")
+        time.sleep(poll_interval)
+
+
+def extend_series(series, n_values, tolerance=0.001, consecutive=2):
+    """
+    Decide which values of a parameter to compute next for several series of calculations, for example one
+    series of increasing k-point densities for each value of the smearing.
+
+    Each series is extended until the energies of a given number of consecutive steps before the last one are
+    all within tolerance of the last energy. Since this cannot happen before that number of new values has
+    been computed, each extension contains as many values, so that they can be submitted together. A series
+    also stops when it coincides within tolerance with a series having a larger key, e.g. a larger smearing,
+    on all common values, since it would not add any information.
+
+    :param series: dictionary from the key of each series to the list of energies per atom computed so far,
+        one for each of the first trial values.
+    :param n_values: number of trial values.
+    :param tolerance: maximum energy change in eV/atom.
+    :param consecutive: number of consecutive steps in which the energy change must be below tolerance.
+    :return: dictionary from the key of each series which must be extended to the list of indices of the next
+        values.
+    """
+    todo = {}
+    keys = sorted(series)
+    for i, key in enumerate(keys):
+        energies = series[key]
+        if len(energies) < consecutive + 1:
+            if len(energies) < n_values:
+                todo[key] = list(range(len(energies), min(consecutive + 1, n_values)))
+            continue
+
+        changes = [abs(energies[-1] - energies[j]) for j in range(-consecutive - 1, -1)]
+        if len(energies) == n_values or max(changes) < tolerance:
+            continue
+
+        coincident = False
+        for other in keys[i + 1:]:
+            common = min(len(energies), len(series[other]))
+            if common > consecutive and all(abs(energies[j] - series[other][j]) < tolerance for j in range(common)):
+                coincident = True
+                break
+
+        if not coincident:
+            todo[key] = list(range(len(energies), min(len(energies) + consecutive, n_values)))
+
+    return todo
@@ -0,0 +1,162 @@
+"""
+automag.common.cost
+===================
+
+Functions which estimate the cost of VASP calculations, in order to request suitable resources from the
+queue management system and to start the most expensive calculations first.
+
+The cost of a calculation is estimated from the number of plane waves, bands, k-points and spin
+components, and it is converted into core-seconds with the median ratio observed in previous runs.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import numpy as np
+
+from pymatgen.core.periodic_table import Element
+
+from common.results import append_record, read_records
+
+# substitute with the number of cores of one node of your cluster and the maximum number of nodes per job
+CORES_PER_NODE = 16
+MAX_NODES = 4
+
+# walltime in hours which calculations should not exceed if possible, and maximum walltime of the queue
+TARGET_HOURS = 12
+MAX_HOURS = 48
+
+# requested walltime is the estimated one multiplied by this factor
+SAFETY_FACTOR = 2.0
+
+# core-seconds per unit of cost, used until the runtimes of previous calculations are available
+DEFAULT_CORE_SECONDS_PER_COST = 2e-5
+
+# number of previous calculations used to calibrate the cost model
+HISTORY_SIZE = 50
+
+# atomic numbers of noble gases, to estimate the number of valence electrons
+NOBLE_GASES = [0, 2, 10, 18, 36, 54, 86]
+
+
+def runtimes_file():
+    """
+    Path to the file containing the runtimes of previous calculations.
+
+    :return: path to the runtimes file.
+    """
+    return os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold', 'runtimes.jsonl')
+
+
+def valence_electrons(symbol):
+    """
+    Estimate the number of valence electrons of an element as the electrons beyond the previous noble gas.
+
+    :param symbol: chemical symbol.
+    :return: number of valence electrons.
+    """
+    z = Element(symbol).Z
+    return z - max(item for item in NOBLE_GASES if item < z)
+
+
+def estimate_cost(atoms, params, ispin=1):
+    """
+    Estimate the cost of a self-consistent VASP calculation in arbitrary units.
+
+    :param atoms: ase Atoms object.
+    :param params: VASP parameters as given to the ASE calculator.
+    :param ispin: number of spin components.
+    :return: estimated cost.
+    """
+    # number of plane waves within the cut-off sphere, hbar^2 / 2m = 3.81 eV Ang^2
+    encut = params.get('encut', 400)
+    n_pw = atoms.get_volume() * (encut / 3.81) ** 1.5 / (6 * np.pi ** 2)
+
+    # default number of bands of VASP
+    n_electrons = sum(valence_electrons(symbol) for symbol in atoms.get_chemical_symbols())
+    n_bands = max(n_electrons / 2 + len(atoms) / 2, 0.6 * n_electrons)
+
+    # fully automatic k-point mesh with length kpts, halved by time-reversal symmetry
+    kpts = params.get('kpts', 1)
+    if np.ndim(kpts) == 0:
+        reciprocal_lengths = np.linalg.norm(atoms.cell.reciprocal(), axis=1)
+        mesh = np.maximum(1, np.floor(kpts * reciprocal_lengths + 0.5))
+    else:
+        mesh = np.array(kpts)
+    n_kpts = max(1, np.prod(mesh) / 2)
+
+    # FFTs and orthonormalization of the bands
+    return ispin * n_kpts * (n_bands * n_pw * np.log2(n_pw) + n_bands ** 2 * n_pw)
+
+
+def core_seconds_per_cost():
+    """
+    Median ratio between core-seconds and estimated cost of the most recent calculations.
+
+    :return: core-seconds per unit of cost.
+    """
+    try:
+        records = read_records(runtimes_file())[-HISTORY_SIZE:]
+    except FileNotFoundError:
+        records = []
+
+    if not records:
+        return DEFAULT_CORE_SECONDS_PER_COST
+    return float(np.median([record['seconds'] * record['ntasks'] / record['cost'] for record in records]))
+
+
+def add_runtime(cost, seconds, ntasks):
+    """
+    Store the runtime of a calculation to calibrate the cost model.
+
+    :param cost: estimated cost of the calculation.
+    :param seconds: wall time of the calculation.
+    :param ntasks: number of cores used by the calculation.
+    """
+    append_record(runtimes_file(), {'cost': cost, 'seconds': seconds, 'ntasks': ntasks})
+
+
+def to_walltime(seconds):
+    """
+    Convert seconds to a walltime string in the format HH:MM:SS.
+
+    :param seconds: number of seconds.
+    :return: walltime string.
+    """
+    seconds = int(np.ceil(seconds))
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+
+def estimate_resources(cost, ncore=1, scale=None):
+    """
+    Choose the number of cores, the walltime and the priority of a calculation with a given cost.
+
+    The number of cores is the smallest one, among multiples of ncore which divide a node (ncore itself if
+    none does) and multiples of a node rounded up to a multiple of ncore, which allows to complete the
+    calculation within the target walltime.
+
+    :param cost: estimated cost of the calculation.
+    :param ncore: value of the VASP parameter NCORE, which should divide the number of cores.
+    :param scale: core-seconds per unit of cost, read from previous runs if not given.
+    :return: dictionary with the '_queueadapter' and '_priority' keys of a firework spec.
+    """
+    if scale is None:
+        scale = core_seconds_per_cost()
+    core_seconds = cost * scale
+
+    candidates = [item for item in range(ncore, CORES_PER_NODE + 1, ncore) if CORES_PER_NODE % item == 0] or [ncore]
+    candidates += [int(np.ceil(CORES_PER_NODE * nodes / ncore)) * ncore for nodes in range(2, MAX_NODES + 1)]
+    candidates = sorted(set(item for item in candidates if item <= CORES_PER_NODE * MAX_NODES)) or [ncore]
+
+    ntasks = candidates[-1]
+    for candidate in candidates:
+        if SAFETY_FACTOR * core_seconds / candidate <= TARGET_HOURS * 3600:
+            ntasks = candidate
+            break
+
+    seconds = min(MAX_HOURS * 3600, max(1800, SAFETY_FACTOR * core_seconds / ntasks))
+
+    return {
+        '_queueadapter': {'ntasks': ntasks, 'walltime': to_walltime(seconds)},
+        '_priority': int(core_seconds),
+    }
@@ -0,0 +1,292 @@
+"""
+automag.common.enumeration
+==========================
+
+Functions which enumerate derivative superstructures and their magnetic labelings.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import time
+import numpy as np
+
+from itertools import product, combinations
+from scipy.spatial import cKDTree
+from pymatgen.core.lattice import Lattice
+from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+
+def hermite_normal_forms(size):
+    """
+    Generate all supercell matrices of a given size in Hermite normal form.
+
+    The rows of each matrix are the supercell vectors in fractional coordinates of the parent lattice.
+
+    :param size: determinant of the supercell matrices.
+    :return: generator of integer arrays of shape (3, 3).
+    """
+    for a in range(1, size + 1):
+        if size % a != 0:
+            continue
+        for c in range(1, size // a + 1):
+            if (size // a) % c != 0:
+                continue
+            f = size // (a * c)
+            for b, d, e in product(range(a), range(a), range(c)):
+                yield np.array([[a, 0, 0], [b, c, 0], [d, e, f]])
+
+
+def reduce_translations(vectors, hnf):
+    """
+    Map integer translations of the parent lattice to their index in the supercell.
+
+    :param vectors: integer array of shape (..., 3) with translations in the parent lattice.
+    :param hnf: supercell matrix in Hermite normal form.
+    :return: integer array of shape (...) with indices between 0 and the size of the supercell.
+    """
+    vectors = np.array(vectors, dtype=int)
+    for row in [2, 1, 0]:
+        pivot = hnf[row, row]
+        vectors -= np.floor_divide(vectors[..., row], pivot)[..., np.newaxis] * hnf[row]
+
+    return (vectors[..., 0] * hnf[1, 1] + vectors[..., 1]) * hnf[2, 2] + vectors[..., 2]
+
+
+def match_sites(images, frac_coords, tol=1e-3):
+    """
+    Find the sites which coincide with a set of points, modulo lattice translations.
+
+    :param images: fractional coordinates of the points.
+    :param frac_coords: fractional coordinates of the sites.
+    :param tol: tolerance on fractional coordinates.
+    :return: integer array with the index of the site matching each point, None if some point does not
+        coincide with any site.
+    """
+    # periodic KD-tree on coordinates wrapped into [0, 1), the second modulo turns 1.0 into 0.0
+    tree = cKDTree(np.mod(np.mod(frac_coords, 1), 1), boxsize=1)
+    distances, mapping = tree.query(np.mod(np.mod(images, 1), 1), p=np.inf)
+    if np.any(distances >= tol):
+        return None
+
+    return mapping
+
+
+def site_permutations(frac_coords, symmops, hnf, tol=1e-3):
+    """
+    Represent the symmetry operations of the parent structure as permutations of the supercell sites.
+
+    Supercell sites are ordered by parent site first and by lattice translation second, so that site
+    p * size + t is the image of parent site p shifted by the t-th translation of the supercell. Only
+    the operations which leave the superlattice invariant are kept and each of them is combined with
+    all lattice translations of the parent structure inside the supercell.
+
+    :param frac_coords: fractional coordinates of the parent sites.
+    :param symmops: symmetry operations of the parent structure in fractional coordinates.
+    :param hnf: supercell matrix in Hermite normal form.
+    :param tol: tolerance on fractional coordinates for mapping sites onto each other.
+    :return: tuple with the integer array of shape (operations, sites) of the permutations and the
+        integer array of shape (size, 3) with the lattice translations inside the supercell.
+    """
+    size = int(round(abs(np.linalg.det(hnf))))
+    inv_hnf = np.linalg.inv(hnf)
+    translations = np.array(list(product(range(hnf[0, 0]), range(hnf[1, 1]), range(hnf[2, 2]))))
+
+    permutations = []
+    for op in symmops:
+        rotation = np.around(op.rotation_matrix).astype(int)
+
+        # skip operations which do not leave the superlattice invariant
+        transformed = np.dot(np.dot(hnf, rotation.T), inv_hnf)
+        if not np.allclose(transformed, np.around(transformed), atol=tol):
+            continue
+
+        # image of each parent site and the lattice vector by which it is shifted
+        images = op.operate_multi(frac_coords)
+        parent_mapping = match_sites(images, frac_coords, tol)
+        if parent_mapping is None:
+            raise ValueError('Symmetry operation does not map the structure onto itself.')
+        shifts = np.around(images - frac_coords[parent_mapping]).astype(int)
+
+        for origin in translations:
+            moved = np.dot(translations + origin, rotation.T)
+            indices = reduce_translations(moved[np.newaxis, :, :] + shifts[:, np.newaxis, :], hnf)
+            permutations.append((parent_mapping[:, np.newaxis] * size + indices).ravel())
+
+    return np.array(permutations), translations
+
+
+def unique_supercells(size, symmops, tol=1e-3):
+    """
+    Generate the supercell matrices of a given size which are not equivalent by symmetry.
+
+    :param size: determinant of the supercell matrices.
+    :param symmops: symmetry operations of the parent structure in fractional coordinates.
+    :param tol: numerical tolerance.
+    :return: list of integer arrays of shape (3, 3).
+    """
+    rotations = [np.around(op.rotation_matrix).astype(int) for op in symmops]
+
+    supercells = []
+    for hnf in hermite_normal_forms(size):
+        equivalent = False
+        for kept in supercells:
+            inv_kept = np.linalg.inv(kept)
+            for rotation in rotations:
+                transformed = np.dot(np.dot(hnf, rotation.T), inv_kept)
+                if np.allclose(transformed, np.around(transformed), atol=tol):
+                    equivalent = True
+                    break
+            if equivalent:
+                break
+
+        if not equivalent:
+            supercells.append(hnf)
+
+    return supercells
+
+
+def enumerate_derivatives(symmetrized_structure, split, max_size, deadline=None):
+    """
+    Enumerate the derivative superstructures in which each split Wyckoff position is divided into two
+    halves, removing symmetrically equivalent and superperiodic labelings.
+
+    Each Wyckoff position gets a label, or two consecutive labels if it is split, following the order of
+    the equivalent sites of the symmetrized structure.
+
+    :param symmetrized_structure: pymatgen SymmetrizedStructure object of the parent structure.
+    :param split: sequence with one flag for each Wyckoff position, true if it has to be split.
+    :param max_size: maximum size of the supercells in multiples of the parent structure.
+    :param deadline: time in seconds since the epoch after which TimeoutError is raised, no limit if None.
+    :return: generator of tuples with the pymatgen Lattice, the fractional coordinates of the sites and
+        the integer array with the label of each site.
+    """
+    frac_coords = symmetrized_structure.frac_coords
+    symmops = symmetrized_structure.spacegroup
+    num_sites = len(frac_coords)
+
+    # first label of each Wyckoff position and Wyckoff position of each parent site
+    first_labels = np.cumsum([0] + [2 if s else 1 for s in split])[:-1]
+    site_wyckoff = np.empty(num_sites, dtype=int)
+    for i, indices in enumerate(symmetrized_structure.equivalent_indices):
+        site_wyckoff[indices] = i
+
+    for size in range(1, max_size + 1):
+        for hnf in unique_supercells(size, symmops):
+            permutations, translations = site_permutations(frac_coords, symmops, hnf)
+            base_labels = np.repeat(first_labels[site_wyckoff], size)
+
+            # permutations of the nontrivial lattice translations alone
+            shifted = reduce_translations(translations[:, np.newaxis, :] + translations[np.newaxis, :, :], hnf)
+            pure_translations = np.arange(num_sites)[np.newaxis, :, np.newaxis] * size + shifted[:, np.newaxis, :]
+            pure_translations = pure_translations.reshape(size, -1)[1:]
+
+            # each split Wyckoff position is divided in two halves
+            blocks = [np.nonzero(np.repeat(site_wyckoff == i, size))[0] for i, s in enumerate(split) if s]
+            if any(len(block) % 2 for block in blocks):
+                continue
+            choices = [combinations(block, len(block) // 2) for block in blocks]
+
+            lattice = Lattice(np.dot(hnf, symmetrized_structure.lattice.matrix))
+            coords = np.repeat(frac_coords, size, axis=0) + np.tile(translations, (num_sites, 1))
+            coords = np.mod(np.dot(coords, np.linalg.inv(hnf)), 1)
+
+            seen = set()
+            for choice in product(*choices):
+                if deadline is not None and time.time() > deadline:
+                    raise TimeoutError('Time budget for the enumeration exceeded.')
+
+                labeling = np.zeros(num_sites * size, dtype=bool)
+                for indices in choice:
+                    labeling[list(indices)] = True
+
+                if np.packbits(labeling).tobytes() in seen:
+                    continue
+
+                # mark the whole orbit of the labeling as seen
+                images = labeling[permutations]
+                seen.update(row.tobytes() for row in np.packbits(images, axis=1))
+
+                # skip labelings which can be described in a smaller cell
+                if np.any(np.all(labeling[pure_translations] == labeling, axis=1)):
+                    continue
+
+                yield lattice, coords, base_labels + labeling
+
+
+def enumerate_split(symmetrized_structure, split, max_size, time_budget=None):
+    """
+    Collect the derivative superstructures of a single split of the Wyckoff positions.
+
+    :param symmetrized_structure: pymatgen SymmetrizedStructure object of the parent structure.
+    :param split: sequence with one flag for each Wyckoff position, true if it has to be split.
+    :param max_size: maximum size of the supercells in multiples of the parent structure.
+    :param time_budget: maximum time in seconds spent on the enumeration, no limit if None.
+    :return: tuple with the list of derivative superstructures found and a flag which is False if the
+        enumeration was stopped by the time budget.
+    """
+    deadline = None if time_budget is None else time.time() + time_budget
+
+    derivatives = []
+    try:
+        for derivative in enumerate_derivatives(symmetrized_structure, split, max_size, deadline):
+            derivatives.append(derivative)
+    except TimeoutError:
+        return derivatives, False
+
+    return derivatives, True
+
+
+def symmetry_permutations(structure, symprec=0.01):
+    """
+    Represent the symmetry operations of a structure as permutations of its sites.
+
+    :param structure: pymatgen Structure object.
+    :param symprec: tolerance for symmetry finding.
+    :return: integer array of shape (operations, sites) where each row gives the image of every site.
+    """
+    analyzer = SpacegroupAnalyzer(structure, symprec=symprec)
+
+    permutations = []
+    for op in analyzer.get_symmetry_operations():
+        mapping = match_sites(op.operate_multi(structure.frac_coords), structure.frac_coords, tol=symprec)
+        if mapping is not None:
+            permutations.append(mapping)
+
+    return np.array(permutations)
+
+
+def prune_configurations(configurations, permutations):
+    """
+    Keep one representative for each set of magnetic configurations related by symmetry or by a global spin flip.
+
+    :param configurations: list of magnetic configurations, one value for each site.
+    :param permutations: integer array of shape (operations, sites) with the symmetry operations as site
+        permutations.
+    :return: tuple with the list of representative configurations and the list of their orbit sizes.
+    """
+    representatives = []
+    multiplicities = []
+    seen = set()
+    for conf in configurations:
+        conf_array = np.asarray(conf, dtype=float)
+
+        # site permutations map site i of the image onto site permutation[i]
+        images = np.empty((len(permutations), len(conf_array)))
+        images[np.arange(len(permutations))[:, np.newaxis], permutations] = conf_array
+
+        # the first non-zero spin of every image is made positive
+        first_nonzero = np.argmax(images != 0, axis=1)
+        signs = np.sign(images[np.arange(len(images)), first_nonzero])
+        signs[signs == 0] = 1
+        images = images * signs[:, np.newaxis] + 0.
+
+        # orbits are either disjoint or identical
+        keys = set(row.tobytes() for row in images)
+        if not keys.isdisjoint(seen):
+            continue
+
+        seen.update(keys)
+        representatives.append(conf)
+        multiplicities.append(len(keys))
+
+    return representatives, multiplicities
@@ -0,0 +1,89 @@
+"""
+automag.common.heisenberg
+=========================
+
+Functions which build the Heisenberg model of a magnetic configuration, shared by the scripts which write
+the Vampire unit cell file and run the built-in Monte Carlo engine.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import numpy as np
+
+from pymatgen.core.structure import Structure
+
+
+def read_configuration(configuration, magnetic_atoms=None, trials_dir='../2_coll/trials'):
+    """
+    Read the spins of a trial configuration and the structure of its setting, keeping only the magnetic atoms.
+
+    :param configuration: name of the configuration, e.g. 'afm1'.
+    :param magnetic_atoms: symbols of the atomic types to be considered magnetic, transition metals if None.
+    :param trials_dir: folder with the trial configurations and settings written by 2_coll/1_submit.py.
+    :return: tuple with the pymatgen Structure object of the magnetic atoms and the list with the material of
+        each of them, 0 for spin up and 1 for spin down.
+    """
+    # raise IOError if no trials folder
+    if not os.path.isdir(trials_dir):
+        raise IOError(f'No trials folder found in {os.path.dirname(trials_dir)}.')
+
+    setting = 1
+    magmom = None
+    while os.path.isfile(f'{trials_dir}/configurations{setting:03d}.txt'):
+        with open(f'{trials_dir}/configurations{setting:03d}.txt', 'rt') as f:
+            for line in f:
+                values = line.split()
+                if values[0] == configuration:
+                    magmom = [int(item) for item in values[2:]]
+                    break
+            if magmom is not None:
+                break
+        setting += 1
+
+    if magmom is None:
+        raise IOError(f'configuration {configuration} not found.')
+
+    # get materials from magmom
+    materials = [0 if item >= 0 else 1 for item in magmom]
+
+    # create a pymatgen Structure object
+    structure = Structure.from_file(f'{trials_dir}/setting{setting:03d}.vasp')
+
+    # find out which atoms are magnetic
+    for element in structure.composition.elements:
+        if magnetic_atoms is None:
+            element.is_magnetic = element.is_transition_metal
+        else:
+            if element.name in magnetic_atoms:
+                element.is_magnetic = True
+            else:
+                element.is_magnetic = False
+
+    non_magnetic_atoms = [element.symbol for element in structure.composition.elements if not element.is_magnetic]
+    structure.remove_species(non_magnetic_atoms)
+
+    return structure, materials
+
+
+def coordination_shells(distances, distances_between_neighbors, n_constants):
+    """
+    Assign each neighbor pair to a coordination shell, i.e. to a coupling constant.
+
+    The shells are separated by the midpoints of consecutive distances between neighbors. Distances equal to
+    a threshold belong to no shell.
+
+    :param distances: distances of the neighbor pairs.
+    :param distances_between_neighbors: distance of each coordination shell.
+    :param n_constants: number of available coupling constants.
+    :return: tuple with the shell index of each pair and the boolean mask of the pairs which belong to a
+        shell with a coupling constant.
+    """
+    thresholds = [(a + b) / 2 for a, b in zip(distances_between_neighbors[:-1], distances_between_neighbors[1:])]
+    thresholds = np.array([0.0] + thresholds + [100.0])
+
+    shells = np.digitize(distances, thresholds) - 1
+    n_shells = min(len(thresholds) - 1, n_constants)
+    mask = (shells >= 0) & (shells < n_shells) & (distances > thresholds[np.clip(shells, 0, len(thresholds) - 1)])
+
+    return shells, mask
@@ -0,0 +1,69 @@
+"""
+automag.common.launchpad
+========================
+
+Functions and classes which provide the launchpad used to submit workflows.
+
+The launchpad is created only when the first workflow is submitted. Its location is read from the
+environment variable AUTOMAG_LAUNCHPAD, which can be either the path to a `my_launchpad.yaml` file or
+the word 'offline'. In the latter case, workflows are not sent to MongoDB but appended to a local file,
+so that enumeration and workflow construction can be run and timed without a database. If the variable
+is not set, the launchpad file configured in FireWorks is used.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import fcntl
+
+from fireworks import LaunchPad
+
+
+_launchpad = None
+
+
+class OfflineLaunchPad(object):
+    """
+    Stand-in for the FireWorks LaunchPad which records workflows in a JSON Lines file.
+
+    Each line contains the dictionary representation of one workflow, which can be read back with
+    Workflow.from_dict. Workflows are not run and fw_ids are not reassigned.
+    """
+    def __init__(self, filename: str = None):
+        if filename is None:
+            filename = os.path.join(os.environ.get('AUTOMAG_PATH', '.'), 'CalcFold', 'offline_launchpad.jsonl')
+        self.filename = filename
+
+    def add_wf(self, wf):
+        self.bulk_add_wfs([wf])
+        return {fw.fw_id: fw.fw_id for fw in wf.fws}
+
+    def bulk_add_wfs(self, wfs):
+        lines = [wf.to_format(f_format='json') + '\n' for wf in wfs]
+
+        with open(self.filename, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.writelines(lines)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_launchpad():
+    """
+    Create the launchpad at the first call and return the same object afterwards.
+
+    :return: FireWorks LaunchPad, or OfflineLaunchPad if AUTOMAG_LAUNCHPAD is set to 'offline'.
+    """
+    global _launchpad
+
+    if _launchpad is None:
+        location = os.environ.get('AUTOMAG_LAUNCHPAD')
+        if location == 'offline':
+            _launchpad = OfflineLaunchPad()
+        elif location is not None:
+            _launchpad = LaunchPad.from_file(location)
+        else:
+            _launchpad = LaunchPad.auto_load()
+
+    return _launchpad
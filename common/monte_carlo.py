@@ -0,0 +1,164 @@
+"""
+automag.common.monte_carlo
+==========================
+
+Functions which run Metropolis Monte Carlo simulations of the classical Heisenberg model
+
+H = - sum_{i<j} J_ij S_i . S_j
+
+with unit spin vectors, the same model simulated by Vampire with the unit cell file written by Automag.
+
+The interactions of the simulated supercell are stored in a sparse matrix. Sites are partitioned into
+groups of non-interacting sites (a generalization of the checkerboard decomposition of the square lattice)
+and all the sites of a group are updated at once, since the moves of non-interacting sites are independent.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import numpy as np
+
+from scipy.sparse import csr_matrix
+
+# Boltzmann constant in J/K
+K_B = 1.380649e-23
+
+
+def supercell_interactions(n_sites, center_indices, point_indices, offset_vectors, exchange, size):
+    """
+    Sparse matrix of the exchange interactions of a periodic supercell.
+
+    Site s of the unit cell translated by (a, b, c) has index ((a * size[1] + b) * size[2] + c) * n_sites + s.
+
+    :param n_sites: number of sites in the unit cell.
+    :param center_indices: indices of the first site of each neighbor pair in the unit cell.
+    :param point_indices: indices of the second site of each neighbor pair in the unit cell.
+    :param offset_vectors: lattice translations of the second site of each neighbor pair.
+    :param exchange: exchange constant of each neighbor pair in J, pairs must appear in both directions.
+    :param size: number of repetitions of the unit cell along each lattice vector.
+    :return: symmetric CSR matrix with the exchange constants between the sites of the supercell.
+    """
+    size = np.asarray(size, dtype=int)
+    cells = np.stack(np.meshgrid(*[np.arange(n) for n in size], indexing='ij'), axis=-1).reshape(-1, 3)
+
+    def cell_indices(translations):
+        translations = np.mod(translations, size)
+        return (translations[..., 0] * size[1] + translations[..., 1]) * size[2] + translations[..., 2]
+
+    offsets = np.rint(offset_vectors).astype(int)
+    rows = cell_indices(cells)[:, np.newaxis] * n_sites + np.asarray(center_indices)[np.newaxis, :]
+    columns = cell_indices(cells[:, np.newaxis, :] + offsets[np.newaxis, :, :]) * n_sites \
+        + np.asarray(point_indices)[np.newaxis, :]
+    values = np.broadcast_to(np.asarray(exchange, dtype=float), rows.shape)
+
+    # in small supercells a site can interact with its own images, which only adds a constant to the energy
+    different = rows != columns
+    n_total = len(cells) * n_sites
+    interactions = csr_matrix((values[different], (rows[different], columns[different])), shape=(n_total, n_total))
+    interactions.sum_duplicates()
+    interactions.eliminate_zeros()
+    return interactions
+
+
+def independent_sets(interactions):
+    """
+    Partition the sites into groups of sites which do not interact with each other, by greedy coloring.
+
+    :param interactions: CSR matrix with the exchange constants between the sites.
+    :return: list of integer arrays with the indices of the sites of each group.
+    """
+    colors = np.full(interactions.shape[0], -1)
+    for site in range(interactions.shape[0]):
+        neighbors = interactions.indices[interactions.indptr[site]:interactions.indptr[site + 1]]
+        used = np.zeros(len(neighbors) + 1, dtype=bool)
+        neighbor_colors = colors[neighbors]
+        used[neighbor_colors[(neighbor_colors >= 0) & (neighbor_colors <= len(neighbors))]] = True
+        colors[site] = np.argmin(used)
+
+    return [np.flatnonzero(colors == color) for color in range(colors.max() + 1)]
+
+
+def metropolis_sweep(spins, groups, temperature, sigma, rng):
+    """
+    Perform one Monte Carlo step, i.e. one trial move per site, updating the spins in place.
+
+    Trial moves are Gaussian displacements of the spin direction of width sigma, normalized to unit length.
+
+    :param spins: array of shape (n_sites, 3) with unit spin vectors.
+    :param groups: list of tuples with the indices of a group of non-interacting sites and the CSR matrix
+        with the rows of the interaction matrix corresponding to these sites.
+    :param temperature: temperature in K.
+    :param sigma: width of the trial moves.
+    :param rng: numpy random number generator.
+    :return: fraction of accepted moves.
+    """
+    accepted = 0
+    for sites, rows in groups:
+        fields = rows @ spins
+        trial = spins[sites] + sigma * rng.standard_normal((len(sites), 3))
+        trial /= np.linalg.norm(trial, axis=1)[:, np.newaxis]
+        delta_energy = -np.einsum('ij,ij->i', trial - spins[sites], fields)
+
+        if temperature > 0:
+            with np.errstate(over='ignore'):
+                accept = rng.random(len(sites)) < np.exp(-delta_energy / (K_B * temperature))
+        else:
+            accept = delta_energy <= 0
+        spins[sites[accept]] = trial[accept]
+        accepted += np.count_nonzero(accept)
+
+    return accepted / len(spins)
+
+
+def magnetization_lengths(spins, materials, n_materials):
+    """
+    Length of the mean spin vector of the whole system and of each material.
+
+    :param spins: array of shape (n_sites, 3) with unit spin vectors.
+    :param materials: integer array with the material of each site.
+    :param n_materials: number of materials.
+    :return: array with the total length followed by the length for each material.
+    """
+    totals = np.zeros((n_materials, 3))
+    np.add.at(totals, materials, spins)
+    counts = np.bincount(materials, minlength=n_materials)
+    lengths = np.linalg.norm(totals, axis=1) / np.maximum(counts, 1)
+    return np.concatenate([[np.linalg.norm(totals.sum(axis=0)) / len(spins)], lengths])
+
+
+def curie_temperature(interactions, materials, temperatures, equilibration_steps, loop_steps, seed=None):
+    """
+    Simulate the system at increasing temperatures, starting each temperature from the final state of the
+    previous one, as done by the curie-temperature program of Vampire.
+
+    The initial spins are parallel to z for the sites of material 0 and antiparallel otherwise. The width of
+    the trial moves is adapted during equilibration to keep the acceptance rate close to 50%.
+
+    :param interactions: CSR matrix with the exchange constants between the sites in J.
+    :param materials: integer array with the material of each site.
+    :param temperatures: temperatures in K.
+    :param equilibration_steps: number of Monte Carlo steps for equilibration at each temperature.
+    :param loop_steps: number of Monte Carlo steps for averaging at each temperature.
+    :param seed: seed of the random number generator.
+    :return: generator of arrays with the temperature, the mean magnetization length of the whole system and
+        of each material.
+    """
+    rng = np.random.default_rng(seed)
+    materials = np.asarray(materials)
+    n_materials = materials.max() + 1
+    groups = [(sites, interactions[sites]) for sites in independent_sets(interactions)]
+
+    spins = np.zeros((len(materials), 3))
+    spins[:, 2] = np.where(materials == 0, 1.0, -1.0)
+
+    sigma = 1.0
+    for temperature in temperatures:
+        for _ in range(equilibration_steps):
+            acceptance = metropolis_sweep(spins, groups, temperature, sigma, rng)
+            sigma = np.clip(sigma * (1.1 if acceptance > 0.5 else 1 / 1.1), 0.01, 10.0)
+
+        lengths = np.zeros(n_materials + 1)
+        for _ in range(loop_steps):
+            metropolis_sweep(spins, groups, temperature, sigma, rng)
+            lengths += magnetization_lengths(spins, materials, n_materials)
+
+        yield np.concatenate([[temperature], lengths / max(loop_steps, 1)])
@@ -0,0 +1,231 @@
+"""
+automag.common.outcar
+=====================
+
+Functions which read the results of VASP calculations from OUTCAR and OSZICAR files.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import re
+import numpy as np
+
+
+def element_symbol(label):
+    """
+    Chemical symbol from a POTCAR label, e.g. 'Fe_pv' or 'H.75'.
+
+    :param label: label of the pseudopotential.
+    :return: chemical symbol.
+    """
+    return re.match('[A-Z][a-z]?', label).group()
+
+
+def read_outcar(filename):
+    """
+    Read the final results of a VASP calculation in a single pass over OUTCAR.
+
+    Only the last occurrence of each block is kept, so that memory usage does not depend on the number
+    of ionic or electronic steps.
+
+    The species are read from the first half of the POTCAR lines, as done by ASE, or from the VRHFIN or
+    TITEL lines if the POTCAR lines are not present.
+
+    :param filename: path to the OUTCAR file.
+    :return: dictionary with the chemical symbols of the atoms, the number of ions per type, the final
+        cell and Cartesian positions, the energy extrapolated to sigma -> 0, the enthalpy (None if not
+        present), the kinetic energy errors per type and the final magnetic moments (None if not present).
+    """
+    potcar_species = []
+    vrhfin_species = []
+    titel_species = []
+    ions_per_type = []
+    errors = []
+    cell = None
+    positions = None
+    magmoms = None
+    energy = None
+    enthalpy_line = None
+
+    with open(filename, 'rt') as f:
+        for line in f:
+            if line.startswith(' POTCAR:'):
+                potcar_species.append(element_symbol(line.split()[2]))
+
+            elif 'VRHFIN' in line:
+                vrhfin_species.append(element_symbol(line.split('=')[1].split(':')[0].strip()))
+
+            elif 'TITEL' in line:
+                titel_species.append(element_symbol(line.split('=')[1].split()[1]))
+
+            elif 'ions per type' in line:
+                ions_per_type = [int(item) for item in line.split('=')[1].split()]
+
+            elif 'kinetic energy error' in line:
+                errors.append(float(line.split()[5]))
+
+            elif 'direct lattice vectors' in line:
+                cell = np.array([[float(item) for item in next(f).split()[:3]] for _ in range(3)])
+
+            elif 'POSITION' in line and 'TOTAL-FORCE' in line:
+                next(f)
+                positions = np.array([[float(item) for item in next(f).split()[:3]]
+                                      for _ in range(sum(ions_per_type))])
+
+            elif 'magnetization (x)' in line:
+                for _ in range(3):
+                    next(f)
+                magmoms = np.array([float(next(f).split()[-1]) for _ in range(sum(ions_per_type))])
+
+            elif 'energy(sigma->0)' in line:
+                energy = float(line.split()[-1])
+
+            elif 'enthalpy' in line:
+                enthalpy_line = line
+
+    # POTCAR lines are printed twice, once at the beginning and once after the header
+    species = potcar_species[:len(potcar_species) // 2] or vrhfin_species or titel_species
+    if len(species) != len(ions_per_type):
+        raise ValueError(f'Found {len(species)} species and {len(ions_per_type)} ion types in {filename}.')
+
+    return {
+        'symbols': [symbol for symbol, amount in zip(species, ions_per_type) for _ in range(amount)],
+        'ions_per_type': ions_per_type,
+        'cell': cell,
+        'positions': positions,
+        'energy': energy,
+        'enthalpy': None if enthalpy_line is None else float(enthalpy_line.split()[4]),
+        'kinetic_energy_errors': errors,
+        'magmoms': magmoms,
+    }
+
+
+def read_tail(filename, headers=(), chunk_size=65536):
+    """
+    Read the last lines of a file, seeking backward from the end until all the given headers are found, so
+    that only the tail of the file is read and each chunk is decoded only once.
+
+    :param filename: path to the file.
+    :param headers: lines, stripped of leading and trailing spaces, which must be included in the tail.
+    :param chunk_size: number of bytes read at each backward step.
+    :return: tuple with the lines read and the set of headers found.
+    """
+    chunks = []
+    found = set()
+    partial = b''
+    with open(filename, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            pieces = (f.read(step) + partial).split(b'\n')
+
+            # the first line may be cut unless the beginning of the file has been reached
+            partial = pieces.pop(0) if position > 0 else b''
+            lines = [piece.decode('latin-1').rstrip('\r') for piece in pieces]
+            chunks.append(lines)
+
+            stripped = {line.strip() for line in lines}
+            found.update(header for header in headers if header in stripped)
+            if found.issuperset(headers):
+                break
+
+    return [line for lines in reversed(chunks) for line in lines], found
+
+
+def read_blocks(filename, headers, chunk_size=65536):
+    """
+    Read the last occurrence of per-ion blocks of OUTCAR, such as 'total charge' or 'magnetization (x)',
+    from the tail of the file.
+
+    :param filename: path to the OUTCAR file.
+    :param headers: headers of the blocks.
+    :param chunk_size: number of bytes read at each backward step.
+    :return: tuple with one NumPy structured array for each block, with one record per ion and one field per
+        column (e.g. 's', 'p', 'd', 'tot').
+    """
+    lines, found = read_tail(filename, headers, chunk_size)
+    for header in headers:
+        if header not in found:
+            raise ValueError(f"No '{header}' block found in {filename}, check that LORBIT is set.")
+
+    stripped = [line.strip() for line in lines]
+    blocks = []
+    for header in headers:
+        # last occurrence of the header, followed by a blank line, the column names and a separator
+        start = len(stripped) - 1 - stripped[::-1].index(header)
+        columns = lines[start + 2].split()[3:]
+
+        rows = []
+        for line in lines[start + 4:]:
+            if line.startswith('---'):
+                break
+            rows.append(tuple(float(item) for item in line.split()[1:]))
+
+        blocks.append(np.array(rows, dtype=[(column, float) for column in columns]))
+
+    return tuple(blocks)
+
+
+def read_charges(filename, chunk_size=65536):
+    """
+    Read the last 'total charge' and 'magnetization (x)' blocks of OUTCAR from the tail of the file.
+
+    :param filename: path to the OUTCAR file.
+    :param chunk_size: number of bytes read at each backward step.
+    :return: tuple with the charges and the magnetic moments as NumPy structured arrays with one record per
+        ion and one field per column (e.g. 's', 'p', 'd', 'tot').
+    """
+    return read_blocks(filename, ['total charge', 'magnetization (x)'], chunk_size)
+
+
+def read_performance(filename):
+    """
+    Read the information about parallelization and resources used by a VASP run from OUTCAR.
+
+    The number of cores, k-points and bands are read from the header, up to the first electronic iteration,
+    while the elapsed time and the maximum memory are read from the timing summary at the tail of the file,
+    so that the ionic steps in between are never read.
+
+    :param filename: path to the OUTCAR file.
+    :return: dictionary with the number of cores, k-points and bands, the elapsed time in seconds and the
+        maximum memory used in kB, None for values which are not present.
+    """
+    performance = {'cores': None, 'kpoints': None, 'bands': None, 'elapsed_time': None, 'max_memory': None}
+
+    with open(filename, 'rt') as f:
+        for line in f:
+            if 'running' in line and ('total cores' in line or 'mpi-ranks' in line):
+                performance['cores'] = int(re.search(r'running\s+(?:on\s+)?(\d+)', line).group(1))
+
+            elif 'NKPTS' in line and 'NBANDS' in line:
+                performance['kpoints'] = int(re.search(r'NKPTS\s*=\s*(\d+)', line).group(1))
+                performance['bands'] = int(re.search(r'NBANDS\s*=\s*(\d+)', line).group(1))
+
+            elif 'Iteration' in line or performance['cores'] is not None and performance['bands'] is not None:
+                break
+
+    for line in read_tail(filename)[0]:
+        if 'Elapsed time (sec):' in line:
+            performance['elapsed_time'] = float(line.split(':')[1])
+
+        elif 'Maximum memory used (kb):' in line:
+            performance['max_memory'] = float(line.split(':')[1])
+
+    return performance
+
+
+def count_scf_iterations(filename):
+    """
+    Count the electronic self-consistency iterations of a VASP run, summed over all ionic steps.
+
+    :param filename: path to the OSZICAR file.
+    :return: number of electronic iterations.
+    """
+    # electronic steps are the lines starting with the name of the algorithm, e.g. 'DAV:' or 'RMM:'
+    pattern = re.compile(r'\s*[A-Z]+\s*:\s+\d+\s')
+
+    with open(filename, 'rt') as f:
+        return sum(1 for line in f if pattern.match(line))
@@ -0,0 +1,105 @@
+"""
+automag.common.pack_launcher
+============================
+
+Script which runs many small fireworks inside a single queue allocation.
+
+The cores of the allocation are divided into slots of a given size. Each slot keeps pulling ready
+fireworks with the given names from the launchpad and runs them one after the other, while the slots run
+side by side. No new firework is started when the remaining walltime is shorter than a given margin, so
+that the running ones can finish before the allocation expires. For example, inside a 64-core allocation
+of 24 hours
+
+`python $AUTOMAG_PATH/common/pack_launcher.py --ntasks 64 --ntasks-per-job 16 --walltime 24:00:00`
+
+runs four VASP calculations at a time on 16 cores each.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import time
+import argparse
+import multiprocessing
+
+from fireworks import FWorker
+from fireworks.core.rocket_launcher import rapidfire
+
+from common.launchpad import get_launchpad, OfflineLaunchPad
+
+
+def to_seconds(walltime):
+    """
+    Convert a walltime string to seconds.
+
+    :param walltime: string in the format HH:MM:SS, as in the queue adapter.
+    :return: number of seconds.
+    """
+    hours, minutes, seconds = [int(item) for item in walltime.split(':')]
+    return 3600 * hours + 60 * minutes + seconds
+
+
+def run_slot(ntasks_per_job, fw_names, launch_dir, deadline):
+    """
+    Run fireworks one after the other in a slot, until there are no more fireworks or time is over.
+
+    :param ntasks_per_job: number of MPI tasks of each VASP calculation.
+    :param fw_names: names of the fireworks which can be run.
+    :param launch_dir: directory in which launch directories are created.
+    :param deadline: time after which no new firework is started.
+    """
+    # read by ase/run_vasp.py
+    os.environ['AUTOMAG_NTASKS'] = str(ntasks_per_job)
+
+    # each process opens its own connection to the database
+    launchpad = get_launchpad()
+    if isinstance(launchpad, OfflineLaunchPad):
+        raise ValueError('Fireworks cannot be run from the offline launchpad.')
+
+    fworker = FWorker(name='automag pack launcher', query={'name': {'$in': list(fw_names)}})
+    rapidfire(launchpad, fworker, m_dir=launch_dir, nlaunches=0, timeout=max(0, int(deadline - time.time())))
+
+
+def pack_launch(ntasks, ntasks_per_job, walltime, margin='01:00:00',
+                fw_names=('singlepoint', 'recalc', 'write_output'), launch_dir='.'):
+    """
+    Run fireworks side by side in slots of ntasks_per_job cores until the walltime is almost over.
+
+    :param ntasks: total number of cores of the allocation.
+    :param ntasks_per_job: number of cores of each VASP calculation.
+    :param walltime: walltime of the allocation in the format HH:MM:SS.
+    :param margin: no new firework is started when less than this time is left, in the format HH:MM:SS.
+    :param fw_names: names of the fireworks which can be run.
+    :param launch_dir: directory in which launch directories are created.
+    """
+    n_slots = ntasks // ntasks_per_job
+    if n_slots == 0:
+        raise ValueError(f'Cannot run jobs with {ntasks_per_job} cores each on {ntasks} cores.')
+
+    deadline = time.time() + to_seconds(walltime) - to_seconds(margin)
+    launch_dir = os.path.abspath(launch_dir)
+
+    context = multiprocessing.get_context('fork')
+    slots = [context.Process(target=run_slot, args=(ntasks_per_job, fw_names, launch_dir, deadline))
+             for _ in range(n_slots)]
+    for slot in slots:
+        slot.start()
+        # do not pull fireworks from the database at exactly the same time
+        time.sleep(1)
+    for slot in slots:
+        slot.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run many fireworks inside a single queue allocation.')
+    parser.add_argument('--ntasks', type=int, required=True, help='total number of cores of the allocation')
+    parser.add_argument('--ntasks-per-job', type=int, required=True, help='number of cores of each calculation')
+    parser.add_argument('--walltime', required=True, help='walltime of the allocation (HH:MM:SS)')
+    parser.add_argument('--margin', default='01:00:00',
+                        help='do not start new fireworks when less than this time is left (HH:MM:SS)')
+    parser.add_argument('--fw-names', nargs='+', default=['singlepoint', 'recalc', 'write_output'],
+                        help='names of the fireworks to run')
+    parser.add_argument('--launch-dir', default='.', help='directory in which launch directories are created')
+    args = parser.parse_args()
+
+    pack_launch(args.ntasks, args.ntasks_per_job, args.walltime, args.margin, args.fw_names, args.launch_dir)
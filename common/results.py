@@ -0,0 +1,96 @@
+"""
+automag.common.results
+======================
+
+Functions which store and retrieve the results of the calculations in the CalcFold folder.
+
+Results are kept in one JSON Lines file for each material and mode. Each record is written with a single
+call while holding an exclusive lock on the file, so that many workers can append results at the same
+time without interleaving their lines, also on shared filesystems where SQLite cannot be used safely.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import json
+import fcntl
+
+
+def results_file(material, mode):
+    """
+    Path to the file containing the results for a given material and mode.
+
+    :param material: empirical chemical formula of the material.
+    :param mode: calculation mode, e.g. 'encut', 'kgrid', 'perturbations' or 'singlepoint'.
+    :return: path to the results file.
+    """
+    return os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold', f'{material}_{mode}.jsonl')
+
+
+def append_record(filename, record):
+    """
+    Atomically append a JSON record to a JSON Lines file.
+
+    :param filename: path to the file.
+    :param record: JSON serializable dictionary.
+    """
+    line = json.dumps(record) + '\n'
+
+    with open(filename, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_records(filename):
+    """
+    Read all records of a JSON Lines file.
+
+    :param filename: path to the file.
+    :return: list of dictionaries.
+    """
+    with open(filename, 'r') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            lines = f.readlines()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def add_result(material, mode, state, fw_id, data):
+    """
+    Atomically append a record to the results file.
+
+    :param material: empirical chemical formula of the material.
+    :param mode: calculation mode.
+    :param state: name of the calculated state, unique together with fw_id.
+    :param fw_id: id of the first firework of the workflow.
+    :param data: dictionary with JSON serializable results.
+    """
+    record = {'material': material, 'mode': mode, 'state': state, 'fw_id': fw_id}
+    record.update(data)
+    append_record(results_file(material, mode), record)
+
+
+def read_results(material, mode):
+    """
+    Read all records for a given material and mode.
+
+    If the same state has been written more than once by the same workflow, for example because a
+    firework has been rerun, only the last record is kept.
+
+    :param material: empirical chemical formula of the material.
+    :param mode: calculation mode.
+    :return: list of dictionaries in the order in which states were first written.
+    """
+    records = {}
+    for record in read_records(results_file(material, mode)):
+        records[(record['state'], record['fw_id'])] = record
+
+    return list(records.values())
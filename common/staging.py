@@ -0,0 +1,100 @@
+"""
+automag.common.staging
+======================
+
+Functions which stage large files, such as WAVECAR and CHGCAR, from the launch directory of a previous
+firework into the current one.
+
+When source and destination are on the same filesystem, the file is first cloned with a reflink, which
+shares the data blocks with copy-on-write semantics and is therefore always safe. Files which the new
+run only reads can also be hardlinked or symlinked. Otherwise, the file is copied in a streaming fashion.
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import fcntl
+import shutil
+
+# ioctl request for cloning a file on Linux filesystems which support reflinks (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    """
+    Clone a file sharing its data blocks.
+
+    :param source: path to the source file.
+    :param destination: path to the destination file.
+    """
+    with open(source, 'rb') as f_src, open(destination, 'wb') as f_dst:
+        try:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        except OSError:
+            f_dst.close()
+            os.remove(destination)
+            raise
+
+
+def stage_file(source, destination, read_only=False, symlink=True, copy=True):
+    """
+    Make a file of a previous run available to the current one, moving as little data as possible.
+
+    :param source: path to the source file.
+    :param destination: path to the destination file, which is overwritten if it exists.
+    :param read_only: True if the current run will not write on the file, in which case hardlinks and
+        symlinks can be used because the source file cannot be modified.
+    :param symlink: False if the destination must remain valid when the source is deleted.
+    :param copy: False if the file must not be copied when it cannot be linked.
+    :return: tuple with the method used ('reflink', 'hardlink', 'symlink' or 'copy', None if the file was not
+        staged) and the number of bytes copied.
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    same_filesystem = os.stat(source).st_dev == os.stat(os.path.dirname(os.path.abspath(destination))).st_dev
+    if same_filesystem:
+        try:
+            reflink(source, destination)
+            return 'reflink', 0
+        except OSError:
+            pass
+
+        if read_only:
+            try:
+                os.link(source, destination)
+                return 'hardlink', 0
+            except OSError:
+                pass
+
+            if symlink:
+                try:
+                    os.symlink(os.path.abspath(source), destination)
+                    return 'symlink', 0
+                except OSError:
+                    pass
+
+    if not copy:
+        return None, 0
+
+    # shutil.copyfile streams the data, in kernel space where possible
+    shutil.copyfile(source, destination)
+    return 'copy', os.path.getsize(destination)
+
+
+def stage_files(launch_dir, filenames, read_only):
+    """
+    Stage files from the launch directory of a previous run into the current directory and print a summary.
+
+    :param launch_dir: launch directory of the previous run.
+    :param filenames: names of the files to stage.
+    :param read_only: list with one boolean for each file, True if the current run will not write on it.
+    :return: total number of bytes copied.
+    """
+    total = 0
+    for filename, is_read_only in zip(filenames, read_only):
+        method, copied = stage_file(os.path.join(launch_dir, filename), filename, read_only=is_read_only)
+        print(f'{filename} staged from {launch_dir} by {method}, {copied} bytes copied')
+        total += copied
+
+    return total
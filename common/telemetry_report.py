@@ -0,0 +1,91 @@
+"""
+automag.common.telemetry_report
+===============================
+
+Script which summarizes the performance telemetry of VASP runs stored in CalcFold.
+
+Runs are grouped by material, calculation mode, step and number of cores. For each group the script prints
+the number of runs, the total core-hours, the average number of electronic iterations, the average wall time
+per iteration, the core-seconds per iteration divided by the estimated cost of the run and the maximum
+memory used. A normalized cost per iteration which grows with the number of cores indicates that the
+calculations do not scale well and should be run on fewer cores. Usage:
+
+`python $AUTOMAG_PATH/common/telemetry_report.py [MATERIAL]`
+
+.. codeauthor:: Michele Galasso <m.galasso@yandex.com>
+"""
+
+import os
+import sys
+import glob
+import numpy as np
+
+from common.results import read_records
+
+
+def read_telemetry(material=None):
+    """
+    Read the telemetry records of all runs.
+
+    :param material: empirical chemical formula of the material, all materials if None.
+    :return: list of tuples with material, calculation mode and telemetry record.
+    """
+    pattern = f"{material or '*'}_*_telemetry.jsonl"
+    rows = []
+    for filename in sorted(glob.glob(os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold', pattern))):
+        for record in read_records(filename):
+            rows.append((record['material'], record['mode'][:-len('_telemetry')], record))
+
+    return rows
+
+
+def summarize(rows):
+    """
+    Aggregate telemetry records by material, calculation mode, step and number of cores.
+
+    :param rows: list of tuples with material, calculation mode and telemetry record.
+    :return: list of dictionaries, one for each group.
+    """
+    groups = {}
+    for material, mode, record in rows:
+        cores = record['cores'] or record['ntasks'] or 1
+        groups.setdefault((material, mode, record['step'], cores), []).append(record)
+
+    summary = []
+    for (material, mode, step, cores), records in sorted(groups.items()):
+        wall_times = np.array([record['wall_time'] for record in records])
+        iterations = np.array([record['scf_iterations'] or 0 for record in records])
+        costs = np.array([record['cost'] or np.nan for record in records])
+        memory = [record['max_memory'] for record in records if record['max_memory'] is not None]
+
+        has_iterations = iterations > 0
+        seconds_per_iteration = wall_times[has_iterations] / iterations[has_iterations]
+        summary.append({
+            'material': material,
+            'mode': mode,
+            'step': step,
+            'cores': cores,
+            'runs': len(records),
+            'core_hours': float(np.sum(wall_times) * cores / 3600),
+            'iterations': float(np.mean(iterations)),
+            'seconds_per_iteration': float(np.mean(seconds_per_iteration)) if has_iterations.any() else np.nan,
+            'normalized_cost': float(np.nanmean(seconds_per_iteration * cores / costs[has_iterations] * 1e9))
+            if has_iterations.any() and not np.isnan(costs[has_iterations]).all() else np.nan,
+            'max_memory_gb': max(memory) / 1024 ** 2 if memory else np.nan,
+        })
+
+    return summary
+
+
+if __name__ == '__main__':
+    summary = summarize(read_telemetry(sys.argv[1] if len(sys.argv) > 1 else None))
+    if not summary:
+        print('No telemetry found in CalcFold.')
+        sys.exit()
+
+    print(f"{'material':>12s} {'mode':>13s} {'step':>11s} {'cores':>5s} {'runs':>5s} {'core-h':>9s} "
+          f"{'iter':>6s} {'s/iter':>8s} {'core-s/iter/Gcost':>17s} {'mem (GB)':>8s}")
+    for row in summary:
+        print(f"{row['material']:>12s} {row['mode']:>13s} {row['step']:>11s} {row['cores']:5d} {row['runs']:5d} "
+              f"{row['core_hours']:9.2f} {row['iterations']:6.1f} {row['seconds_per_iteration']:8.2f} "
+              f"{row['normalized_cost']:17.3f} {row['max_memory_gb']:8.2f}")
@@ -9,17 +9,23 @@ Classes and functions to efficiently handle FireWorks calculations.
 
 import os
 import json
-import shutil
+import time
 import numpy as np
 
 from ase import Atoms
 from ase.io import read
 from ase.calculators.vasp import Vasp
-from fireworks import FiretaskBase, explicit_serialize
+from fireworks import Firework, Workflow, FiretaskBase, FWAction, explicit_serialize
 from pymatgen.core.structure import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from pymatgen.core.periodic_table import Element
-from pymatgen.io.vasp import Incar, Outcar
+from pymatgen.io.vasp import Incar
+
+from common.outcar import read_outcar, read_charges, read_blocks, read_performance, count_scf_iterations
+from common.results import add_result
+from common.cost import add_runtime
+from common.cache import calculation_key, read_cache_key, restore_calculation, store_calculation
+from common.staging import stage_files
 
 
 def atoms_to_encode(atoms):
@@ -60,6 +66,58 @@ def encode_to_atoms(encode):
     return atoms
 
 
+def can_warm_start(launch_dir, calc_params, magmoms):
+    """
+    Check whether a VASP run can be restarted from the WAVECAR and CHGCAR files of a previous run.
+
+    The atoms are read from the OUTCAR of the previous run and the k-points are generated from the same
+    parameters, so the basis set is the same if the cut-off energy and the number of spin components are.
+    Since VASP takes the magnetization density from CHGCAR and ignores MAGMOM, the run is restarted only if
+    it also starts from the same magnetic moments as the previous run.
+
+    :param launch_dir: launch directory of the previous run.
+    :param calc_params: VASP parameters of the new run, in lowercase as given to the ASE calculator.
+    :param magmoms: initial magnetic moments of the new run, in the order of the atoms of the previous run.
+    :return: True if the new run can start from the files of the previous run.
+    """
+    for filename in ['WAVECAR', 'CHGCAR']:
+        path = os.path.join(launch_dir, filename)
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return False
+
+    incar = Incar.from_file(os.path.join(launch_dir, 'INCAR'))
+    previous_magmoms = np.asarray(incar.get('MAGMOM', np.zeros(len(magmoms))), dtype=float)
+    if previous_magmoms.shape != np.shape(magmoms) or not np.allclose(previous_magmoms, magmoms):
+        return False
+
+    return incar.get('ENCUT') == calc_params.get('encut') and incar.get('ISPIN', 1) == calc_params.get('ispin', 1)
+
+
+def written_vasp_files(calc_params):
+    """
+    WAVECAR and CHGCAR files written by a VASP run, which later runs can restart from.
+
+    :param calc_params: VASP parameters of the run, in lowercase as given to the ASE calculator.
+    :return: list containing 'WAVECAR', 'CHGCAR', both or none.
+    """
+    # VASP writes WAVECAR and CHGCAR unless LWAVE and LCHARG are explicitly set to False
+    params = {'WAVECAR': 'lwave', 'CHGCAR': 'lcharg'}
+    return [filename for filename, param in params.items() if calc_params.get(param, True)]
+
+
+def stage_vasp_files(launch_dir, filenames, calc_params):
+    """
+    Stage WAVECAR and CHGCAR files of a previous run, linking them when VASP is not going to overwrite them.
+
+    :param launch_dir: launch directory of the previous run.
+    :param filenames: list containing 'WAVECAR', 'CHGCAR' or both.
+    :param calc_params: VASP parameters of the new run, in lowercase as given to the ASE calculator.
+    :return: total number of bytes copied.
+    """
+    written = written_vasp_files(calc_params)
+    return stage_files(launch_dir, filenames, [filename not in written for filename in filenames])
+
+
 @explicit_serialize
 class VaspCalculationTask(FiretaskBase):
     """
@@ -67,7 +125,8 @@ class VaspCalculationTask(FiretaskBase):
     """
     _fw_name = 'VaspCalculationTask'
     required_params = ['calc_params']
-    optional_params = ['encode', 'magmoms', 'pert_step', 'pert_value', 'dummy_atom', 'atom_ucalc']
+    optional_params = ['encode', 'magmoms', 'pert_step', 'pert_value', 'dummy_atom', 'atom_ucalc', 'warm_start',
+                       'recalc', 'prev_launch_dir']
 
     def run_task(self, fw_spec):
         # if encode is given, use it as input structure
@@ -76,9 +135,7 @@ class VaspCalculationTask(FiretaskBase):
 
         # else, read the input structure from the output of the previous step
         else:
-            job_info_array = fw_spec['_job_info']
-            prev_job_info = job_info_array[-1]
-            atoms = read(os.path.join(prev_job_info['launch_dir'], 'OUTCAR'))
+            atoms = read(os.path.join(self.previous_launch_dir(fw_spec), 'OUTCAR'))
 
         if 'pert_step' in self:
             atom_ucalc = Element(self['atom_ucalc'])
@@ -107,14 +164,21 @@ class VaspCalculationTask(FiretaskBase):
             self['calc_params']['ldau'] = True
             self['calc_params']['ldautype'] = 3
 
+            # only the WAVECAR of the NSC step is used afterwards, by the following SC step
+            if self['pert_step'] == 'NSC':
+                self['calc_params'].setdefault('lcharg', False)
+            else:
+                self['calc_params'].setdefault('lwave', False)
+                self['calc_params'].setdefault('lcharg', False)
+
+            # if pert_step is NSC, stage also CHGCAR from previous step
             job_info_array = fw_spec['_job_info']
             prev_job_info = job_info_array[-1]
-            shutil.copy(os.path.join(prev_job_info['launch_dir'], 'WAVECAR'), '.')
-
-            # if pert_step is NSC, copy CHGCAR from previous step
             if self['pert_step'] == 'NSC':
-                shutil.copy(os.path.join(prev_job_info['launch_dir'], 'CHGCAR'), '.')
+                stage_vasp_files(prev_job_info['launch_dir'], ['WAVECAR', 'CHGCAR'], self['calc_params'])
                 self['calc_params']['icharg'] = 11
+            else:
+                stage_vasp_files(prev_job_info['launch_dir'], ['WAVECAR'], self['calc_params'])
 
         # if magnetic calculation
         if 'magmoms' in self:
@@ -130,15 +194,50 @@ class VaspCalculationTask(FiretaskBase):
                 self['calc_params']['ispin'] = 2
                 atoms.set_initial_magnetic_moments(magmoms)
 
+        # restart from wavefunctions and charge density of the previous run if it used the same basis set and
+        # the same initial magmoms
+        if self.get('warm_start', False):
+            prev_launch_dir = self.previous_launch_dir(fw_spec)
+            if can_warm_start(prev_launch_dir, self['calc_params'], atoms.get_initial_magnetic_moments()):
+                stage_vasp_files(prev_launch_dir, ['WAVECAR', 'CHGCAR'], self['calc_params'])
+                self['calc_params']['istart'] = 1
+                self['calc_params']['icharg'] = 1
+
         # convert any lists from the parameter settings into arrays
         keys = self['calc_params']
         for k, v in keys.items():
             if isinstance(v, list):
                 keys[k] = np.asarray(v)
 
+        # calculations which depend on the output of the previous one can be cached only if that one was
+        key = None
+        parent_key = None
+        depends_on_previous = 'encode' not in self or 'pert_step' in self or self.get('warm_start', False)
+        if depends_on_previous:
+            parent_key = read_cache_key(self.previous_launch_dir(fw_spec))
+
+        # reuse the outputs of an identical calculation if it has already been run
+        if not depends_on_previous or parent_key is not None:
+            key = calculation_key(atoms_to_encode(atoms), atoms.get_initial_magnetic_moments(), self['calc_params'],
+                                  parent_key)
+            with open('cache_key', 'w') as f:
+                f.write(key)
+            # the WAVECAR and CHGCAR files written by this run are read by a later run
+            if restore_calculation(key, written_vasp_files(self['calc_params'])):
+                action = self.recalc_action(fw_spec) or FWAction()
+                action.stored_data = {'cached': True}
+                return action
+
         # initialize and run VASP
         calc = Vasp(**self['calc_params'])
+        start = time.time()
         calc.calculate(atoms)
+        wall_time = time.time() - start
+
+        # store the runtime to calibrate the cost model
+        ntasks = os.environ.get('AUTOMAG_NTASKS', fw_spec.get('_queueadapter', {}).get('ntasks'))
+        if 'cost' in fw_spec and ntasks is not None:
+            add_runtime(fw_spec['cost'], wall_time, int(ntasks))
 
         # save information about convergence
         with open('is_converged', 'w') as f1:
@@ -150,72 +249,134 @@ class VaspCalculationTask(FiretaskBase):
                         else:
                             f1.write('converged')
 
+        if key is not None:
+            store_calculation(key)
+
+        # performance telemetry of this run
+        if 'pert_step' in self:
+            step = self['pert_step'].lower()
+        else:
+            step = 'singlepoint' if 'encode' in self else 'recalc'
+        telemetry = {
+            'step': step,
+            'wall_time': wall_time,
+            'scf_iterations': count_scf_iterations('OSZICAR') if os.path.isfile('OSZICAR') else None,
+            'ntasks': None if ntasks is None else int(ntasks),
+            'cost': fw_spec.get('cost'),
+            'launch_dir': os.getcwd(),
+        }
+        telemetry.update(read_performance('OUTCAR'))
+        if 'telemetry' in fw_spec:
+            info = fw_spec['telemetry']
+            add_result(info['material'], f"{info['mode']}_telemetry", info['state'], None, telemetry)
+
+        action = self.recalc_action(fw_spec) or FWAction()
+        action.stored_data = telemetry
+        return action
+
+    def previous_launch_dir(self, fw_spec):
+        """
+        Launch directory of the previous run of the workflow.
+
+        :param fw_spec: spec of the firework.
+        :return: path to the launch directory.
+        """
+        if 'prev_launch_dir' in self:
+            return self['prev_launch_dir']
+        return fw_spec['_job_info'][-1]['launch_dir']
+
+    def recalc_action(self, fw_spec):
+        """
+        Add the recalc run to the workflow, between this run and its children, only if the rounded final
+        magnetic moments differ from the initial ones, since otherwise it would repeat the same calculation.
+
+        :param fw_spec: spec of the firework.
+        :return: FWAction with the recalc run as a detour, None if no recalc run is needed.
+        """
+        if 'recalc' not in self:
+            return None
+
+        magmoms = np.array(self['magmoms'], dtype=float)
+        if magmoms.any():
+            final_magmoms = read_blocks('OUTCAR', ['magnetization (x)'])[0]['tot']
+        else:
+            final_magmoms = np.zeros(len(magmoms))
+
+        if np.allclose(final_magmoms.round(), magmoms):
+            return None
+
+        # the recalc run knows the launch directory of this run from its parameters, so that the job info
+        # received by the children lists this run only once
+        recalc_firetask = VaspCalculationTask(magmoms='previous', prev_launch_dir=os.getcwd(), **self['recalc'])
+        spec = {key: value for key, value in fw_spec.items() if key not in ['_tasks', '_fw_env', '_job_info']}
+        return FWAction(detours=[Workflow([Firework([recalc_firetask], name='recalc', spec=spec)])])
+
 
 @explicit_serialize
 class WriteOutputTask(FiretaskBase):
     """
-    Write a simple output file.
+    Store the results of a workflow.
 
-    The file contains the USPEX structure ID, information about convergence of each VASP run,
-    chemical formula, final energy, initial and final magnetic moments for magnetic calculations.
+    The record contains information about convergence and number of electronic iterations of each VASP run,
+    the names of the runs restarted from a previous one, chemical formula, space group, final energy, initial and final magnetic moments for magnetic calculations.
     """
     _fw_name = 'WriteOutputTask'
-    required_params = ['system', 'filename', 'read_enthalpy', 'energy_convergence']
+    required_params = ['system', 'material', 'mode', 'read_enthalpy', 'energy_convergence']
     optional_params = ['initial_magmoms']
 
     def run_task(self, fw_spec):
         job_info_array = fw_spec['_job_info']
-        output_line = '{:12s}  '.format(self['system'])
-        output_line += '{:4d}    '.format(job_info_array[0]['fw_id'])
 
+        convergence = []
+        scf_iterations = []
+        warm_started = []
         for job_info in job_info_array:
             with open(os.path.join(job_info['launch_dir'], 'is_converged'), 'r') as f:
-                output_line += '{:>6s}={:12s}  '.format(job_info['name'], f.readline())
-
-        atoms_final = read(os.path.join(job_info_array[-1]['launch_dir'], 'OUTCAR'))
-        output_line += '{:12s}  '.format(atoms_final.get_chemical_formula(mode='metal'))
-
-        structure = Structure.from_file(os.path.join(job_info_array[-1]['launch_dir'], 'CONTCAR'))
+                convergence.append([job_info['name'], f.readline()])
+            oszicar = os.path.join(job_info['launch_dir'], 'OSZICAR')
+            if os.path.isfile(oszicar):
+                scf_iterations.append([job_info['name'], count_scf_iterations(oszicar)])
+            incar = os.path.join(job_info['launch_dir'], 'INCAR')
+            if os.path.isfile(incar) and Incar.from_file(incar).get('ISTART', 0) == 1:
+                warm_started.append(job_info['name'])
+
+        # read all the needed results with a single pass over OUTCAR
+        outcar = read_outcar(os.path.join(job_info_array[-1]['launch_dir'], 'OUTCAR'))
+        atoms_final = Atoms(outcar['symbols'], positions=outcar['positions'], cell=outcar['cell'], pbc=True)
+        structure = Structure(outcar['cell'], outcar['symbols'], outcar['positions'], coords_are_cartesian=True)
         analyzer = SpacegroupAnalyzer(structure)
-        output_line += '{:10s}  '.format(analyzer.get_space_group_symbol())
+
+        result = {
+            'convergence': convergence,
+            'scf_iterations': scf_iterations,
+            'warm_started': warm_started,
+            'formula': atoms_final.get_chemical_formula(mode='metal'),
+            'spacegroup': analyzer.get_space_group_symbol(),
+        }
 
         if self['energy_convergence']:
-            errors = []
-            with open(os.path.join(job_info_array[-1]['launch_dir'], 'OUTCAR'), 'r') as f:
-                for line in f:
-                    if 'kinetic energy error' in line:
-                        errors.append(float(line.split()[5]))
-
-            _, indices, counts = np.unique(atoms_final.numbers, return_index=True, return_counts=True)
-            num_ions = counts[np.argsort(indices)]
-            correction = sum(np.multiply(errors, num_ions))
+            correction = sum(np.multiply(outcar['kinetic_energy_errors'], outcar['ions_per_type']))
         else:
             correction = 0
 
         if self['read_enthalpy']:
-            # get enthalpy from OUTCAR
-            with open(os.path.join(job_info_array[-1]['launch_dir'], 'OUTCAR'), 'r') as f:
-                for line in f:
-                    if 'enthalpy' in line:
-                        enthalpy_line = line
-
-            output_line += 'enthalpy={}\n'.format(float(enthalpy_line.split()[4]) + correction)
+            result['enthalpy'] = float(outcar['enthalpy'] + correction)
         else:
-            output_line += 'energy={}\n'.format(atoms_final.get_potential_energy() + correction)
+            result['energy'] = float(outcar['energy'] + correction)
 
         if 'initial_magmoms' in self:
             magmoms = np.array(self['initial_magmoms'])
-            output_line += '          initial_magmoms={}  '.format(np.array2string(magmoms, 10000))
 
-            try:
-                magmoms_final = atoms_final.get_magnetic_moments()
-            except:
+            if outcar['magmoms'] is not None:
+                magmoms_final = outcar['magmoms']
+            else:
                 magmoms_final = np.zeros(len(magmoms))
 
-            output_line += 'final_magmoms={}\n'.format(np.array2string(magmoms_final, 10000))
+            result['initial_magmoms'] = magmoms.tolist()
+            result['final_magmoms'] = magmoms_final.tolist()
+
+        add_result(self['material'], self['mode'], self['system'], job_info_array[0]['fw_id'], result)
 
-        with open(os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold', self['filename']), 'a') as f:
-            f.write(output_line)
 
 @explicit_serialize
 class WriteChargesTask(FiretaskBase):
@@ -223,7 +384,7 @@ class WriteChargesTask(FiretaskBase):
     Write charges for U calculation.
     """
     _fw_name = 'WriteChargesTask'
-    required_params = ['filename', 'pert_value', 'dummy_atom']
+    required_params = ['material', 'pert_value', 'dummy_atom']
 
     def run_task(self, fw_spec):
         write_output = True
@@ -251,19 +412,19 @@ class WriteChargesTask(FiretaskBase):
         # get charges
         charges = []
         incar_bare = Incar.from_file(os.path.join(job_info_array[0]['launch_dir'], 'INCAR'))
-        outcar_bare = Outcar(os.path.join(job_info_array[0]['launch_dir'], 'OUTCAR'))
-        bare_magmoms = [item['tot'] for item, ref in zip(outcar_bare.magnetization, incar_bare['MAGMOM']) if ref != 0]
+        _, magnetization_bare = read_charges(os.path.join(job_info_array[0]['launch_dir'], 'OUTCAR'))
+        bare_magmoms = [item for item, ref in zip(magnetization_bare['tot'], incar_bare['MAGMOM']) if ref != 0]
         for step in [1, 2]:
-            outcar = Outcar(os.path.join(job_info_array[step]['launch_dir'], 'OUTCAR'))
+            charge, magnetization = read_charges(os.path.join(job_info_array[step]['launch_dir'], 'OUTCAR'))
             with open(os.path.join(job_info_array[step]['launch_dir'], 'is_converged'), 'r') as f:
                 conv_info = f.readline()
 
-            if 'f' in outcar.charge[dummy_index]:
-                charges.append(outcar.charge[dummy_index]['f'])
+            if 'f' in charge.dtype.names:
+                charges.append(float(charge[dummy_index]['f']))
             else:
-                charges.append(outcar.charge[dummy_index]['d'])
+                charges.append(float(charge[dummy_index]['d']))
 
-            final_magmoms = [item['tot'] for item, ref in zip(outcar.magnetization, incar_bare['MAGMOM']) if ref != 0]
+            final_magmoms = [item for item, ref in zip(magnetization['tot'], incar_bare['MAGMOM']) if ref != 0]
             for bare_magmom, final_magmom in zip(bare_magmoms, final_magmoms):
                 if bare_magmom != 0:
                     # if the magnetic moment changes too much, do not write charges in output
@@ -272,5 +433,5 @@ class WriteChargesTask(FiretaskBase):
                         write_output = False
 
         if write_output:
-            with open(os.path.join(os.environ.get('AUTOMAG_PATH'), 'CalcFold', self['filename']), 'a') as f:
-                f.write(f"{self['pert_value']:5.2f}  {charges[0]}  {charges[1]}\n")
+            add_result(self['material'], 'perturbations', f"{self['pert_value']:.2f}", job_info_array[0]['fw_id'],
+                       {'pert_value': self['pert_value'], 'charges': charges})